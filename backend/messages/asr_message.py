@@ -1,38 +1,286 @@
-from dataclasses import dataclass
-from typing import Any, Dict, Optional
-from .base_message import Message, MessageType
+import sys
+import threading
+from collections import deque
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Union
+from utils.codecs import b64encode_text, dumps_json
+from .base_message import EMPTY_METADATA, Message, MessageType
 
+__all__ = [
+    "AudioChunkMessage",
+    "AudioChunkMessagePool",
+    "TranscriptionData",
+    "TranscriptionMessage",
+    "SpeechEventData",
+    "SpeechEventMessage",
+]
 
-@dataclass
+# Configuration audio standard du pipeline : 80 ms de PCM16 mono à 24 kHz
+STANDARD_SAMPLE_RATE = 24000
+STANDARD_FORMAT = "pcm16"
+CHUNK_SAMPLES = 1920
+CHUNK_BYTES = CHUNK_SAMPLES * 2
+
+AudioBuffer = Union[bytes, bytearray, memoryview]
+
+_AUDIO_DATA_TEMPLATE = dict.fromkeys(("audio_data", "client_id", "sample_rate", "format"))
+
+
+# Les messages ASR stockent leurs champs directement dans des slots : pas de dict
+# intermédiaire alloué par chunk. Le dict "data" historique n'est construit
+# qu'à la demande, pour les consommateurs qui l'utilisent encore.
 class AudioChunkMessage(Message):
-    def __init__(self, audio_data: bytes, client_id: str, sample_rate: int = 24000, 
+    """
+    Chunk audio client. audio_data est conservé tel quel (bytes, bytearray ou
+    memoryview), sans copie : le buffer appartient au message jusqu'à son
+    release() dans le pool. Un consommateur qui doit le garder plus longtemps
+    en fait lui-même une copie avec bytes().
+    """
+    __slots__ = ("audio_data", "client_id", "sample_rate", "format", "_data")
+
+    def __init__(self, audio_data: AudioBuffer, client_id: str, sample_rate: int = 24000, 
                  format: str = "pcm16", metadata: Optional[Dict] = None):
-        data = {
-            "audio_data": audio_data,
-            "client_id": client_id,
-            "sample_rate": sample_rate,
-            "format": format
-        }
-        super().__init__(MessageType.INPUT, data, metadata)
+        self.type = MessageType.INPUT
+        self.metadata = metadata
+        self.audio_data = audio_data
+        # Chaînes à faible cardinalité : internées pour partager une seule instance
+        self.client_id = sys.intern(client_id)
+        self.sample_rate = sample_rate
+        self.format = sys.intern(format)
+        self._data = None
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        if self._data is None:
+            # Copie d'un dict pré-dimensionné : pas de reconstruction/rehash des clés
+            data = _AUDIO_DATA_TEMPLATE.copy()
+            data["audio_data"] = self.audio_data
+            data["client_id"] = self.client_id
+            data["sample_rate"] = self.sample_rate
+            data["format"] = self.format
+            self._data = data
+        return self._data
+
+    def __reduce__(self):
+        # data est une property (pas de setter) : copy/pickle repassent par le
+        # constructeur. Une vue memoryview n'est pas picklable, elle est copiée.
+        audio_data = self.audio_data
+        if isinstance(audio_data, memoryview):
+            audio_data = audio_data.tobytes()
+        return (type(self), (audio_data, self.client_id, self.sample_rate, self.format, self.metadata))
+
+    @classmethod
+    def from_buffer_batch(cls, buffer: AudioBuffer, chunk_size: int, client_ids: Sequence[str],
+                          sample_rate: int = STANDARD_SAMPLE_RATE, format: str = STANDARD_FORMAT,
+                          pool: Optional["AudioChunkMessagePool"] = None) -> List["AudioChunkMessage"]:
+        """
+        Découpe un buffer contigu (bytes, bytearray, memoryview, ndarray...) en
+        len(client_ids) chunks de chunk_size octets. Chaque message référence une
+        tranche du buffer, sans copie.
+        """
+        view = memoryview(buffer).cast("B")
+        if view.nbytes != chunk_size * len(client_ids):
+            raise ValueError(
+                f"Buffer de {view.nbytes} octets incompatible avec {len(client_ids)} chunks de {chunk_size} octets"
+            )
+        
+        build = pool.acquire if pool is not None else cls
+        return [
+            build(view[offset:offset + chunk_size], client_id, sample_rate, format)
+            for offset, client_id in zip(range(0, view.nbytes, chunk_size), client_ids)
+        ]
+
+    def _encode_json(self) -> bytes:
+        # Le JSON n'a pas de type binaire : l'audio n'est encodé en base64 qu'ici,
+        # to_msgpack() reste le chemin normal
+        return dumps_json({
+            "type": int(self.type),
+            "data": {
+                "audio_b64": b64encode_text(self.audio_data),
+                "client_id": self.client_id,
+                "sample_rate": self.sample_rate,
+                "format": self.format
+            },
+            "metadata": self.metadata if self.metadata is not None else EMPTY_METADATA
+        })
+
+
+class AudioChunkMessagePool:
+    """
+    Pool thread-safe d'AudioChunkMessage et de leurs buffers audio.
+
+    Seule la configuration standard (24 kHz, pcm16, chunk de CHUNK_BYTES) est
+    recyclée ; les autres tailles/formats sont alloués normalement. Le consommateur
+    appelle release() une fois le chunk traité : le message ne doit plus être
+    utilisé ensuite.
+    """
+
+    def __init__(self, max_size: int = 64):
+        self.max_size = max_size
+        self._messages = deque()
+        self._buffers = deque()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_standard(audio_data: AudioBuffer, sample_rate: int, format: str) -> bool:
+        if isinstance(audio_data, memoryview):
+            size = audio_data.nbytes
+        else:
+            size = len(audio_data)
+        return (sample_rate == STANDARD_SAMPLE_RATE and format == STANDARD_FORMAT
+                and size == CHUNK_BYTES)
+
+    def acquire(self, audio_data: AudioBuffer, client_id: str, sample_rate: int = STANDARD_SAMPLE_RATE,
+                format: str = STANDARD_FORMAT, metadata: Optional[Dict] = None) -> AudioChunkMessage:
+        message = None
+        if self._is_standard(audio_data, sample_rate, format):
+            with self._lock:
+                if self._messages:
+                    message = self._messages.pop()
+        
+        if message is None:
+            return AudioChunkMessage(audio_data, client_id, sample_rate, format, metadata)
+        
+        # Réutilisation : on rebind les slots en place
+        message.metadata = metadata
+        message.audio_data = audio_data
+        message.client_id = sys.intern(client_id)
+        message.sample_rate = sample_rate
+        message.format = sys.intern(format)
+        message._data = None
+        return message
+
+    def release(self, message: AudioChunkMessage):
+        # Déjà rendu au pool : un second release() ne fait rien
+        if message.audio_data is None:
+            return
+        if not self._is_standard(message.audio_data, message.sample_rate, message.format):
+            return
+        
+        audio_data = message.audio_data
+        message.audio_data = None
+        message.metadata = None
+        message._data = None
+        
+        with self._lock:
+            if len(self._messages) < self.max_size:
+                self._messages.append(message)
+        
+        # Une vue sur un buffer du pool rend le bytearray sous-jacent
+        if isinstance(audio_data, memoryview):
+            buffer = audio_data.obj
+            audio_data.release()
+            audio_data = buffer
+        if isinstance(audio_data, bytearray):
+            self.release_buffer(audio_data)
+
+    def acquire_buffer(self) -> bytearray:
+        """Retourne un bytearray de CHUNK_BYTES dans lequel la capture peut écrire en place"""
+        with self._lock:
+            if self._buffers:
+                return self._buffers.pop()
+        return bytearray(CHUNK_BYTES)
+
+    def release_buffer(self, buffer: bytearray):
+        if len(buffer) != CHUNK_BYTES:
+            return
+        with self._lock:
+            if len(self._buffers) < self.max_size:
+                self._buffers.append(buffer)
+
+
+# Compatibilité avec les consommateurs qui lisent data comme un dict :
+# data["text"], "text" in data, data.get(), keys() et items() se comportent
+# comme sur le dict historique. L'itération reste celle du tuple (valeurs).
+def _field_getitem(self, key):
+    if isinstance(key, str):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+    return tuple.__getitem__(self, key)
+
+
+def _field_contains(self, key) -> bool:
+    return key in self._fields
 
 
-@dataclass
+def _field_get(self, key, default=None):
+    if key in self._fields:
+        return getattr(self, key)
+    return default
+
+
+def _field_keys(self):
+    return self._fields
+
+
+def _field_items(self):
+    return tuple(zip(self._fields, self))
+
+
+class TranscriptionData(NamedTuple):
+    text: str
+    confidence: float = 1.0
+    is_final: bool = True
+
+    __getitem__ = _field_getitem
+    __contains__ = _field_contains
+    get = _field_get
+    keys = _field_keys
+    items = _field_items
+
+
+class SpeechEventData(NamedTuple):
+    event_type: str
+    timestamp: float
+
+    __getitem__ = _field_getitem
+    __contains__ = _field_contains
+    get = _field_get
+    keys = _field_keys
+    items = _field_items
+
+
+# data est un NamedTuple : accès par attribut sans hachage, sans dict alloué
 class TranscriptionMessage(Message):
+    __slots__ = ()
+
     def __init__(self, text: str, confidence: float = 1.0, is_final: bool = True,
                  metadata: Optional[Dict] = None):
-        data = {
-            "text": text,
-            "confidence": confidence,
-            "is_final": is_final
-        }
-        super().__init__(MessageType.OUTPUT, data, metadata)
+        self.type = MessageType.OUTPUT
+        self.data = TranscriptionData(text, confidence, is_final)
+        self.metadata = metadata
+
+    @property
+    def text(self) -> str:
+        return self.data.text
+
+    @property
+    def confidence(self) -> float:
+        return self.data.confidence
+
+    @property
+    def is_final(self) -> bool:
+        return self.data.is_final
+
+    def _wire_data(self) -> Dict[str, Any]:
+        return self.data._asdict()
 
 
-@dataclass
 class SpeechEventMessage(Message):
+    __slots__ = ()
+
     def __init__(self, event_type: str, timestamp: float, metadata: Optional[Dict] = None):
-        data = {
-            "event_type": event_type,
-            "timestamp": timestamp
-        }
-        super().__init__(MessageType.OUTPUT, data, metadata)
\ No newline at end of file
+        self.type = MessageType.OUTPUT
+        self.data = SpeechEventData(sys.intern(event_type), timestamp)
+        self.metadata = metadata
+
+    @property
+    def event_type(self) -> str:
+        return self.data.event_type
+
+    @property
+    def timestamp(self) -> float:
+        return self.data.timestamp
+
+    def _wire_data(self) -> Dict[str, Any]:
+        return self.data._asdict()
@@ -1,36 +1,129 @@
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
-from enum import Enum
+from enum import IntEnum
+from types import MappingProxyType
 
+from utils.codecs import dumps_json, dumps_msgpack, loads_msgpack, msgpack_packer
 
-class MessageType(Enum):
-    INPUT = "input"
-    OUTPUT = "output"
-    ERROR = "error"
-    CONTROL = "control"
+__all__ = [
+    "EMPTY_METADATA",
+    "MessageType",
+    "Message",
+    "InputMessage",
+    "OutputMessage",
+    "ErrorMessage",
+    "MessagePacker",
+]
 
 
-@dataclass
+# Metadata vide partagée (lecture seule), pour les chemins de lecture seulement :
+# un message créé sans metadata garde metadata=None (copiable, picklable), et
+# les lecteurs font `message.metadata or EMPTY_METADATA` sans allouer de dict
+EMPTY_METADATA = MappingProxyType({})
+
+
+# IntEnum : comparaisons entières et un seul entier sur le fil en msgpack
+class MessageType(IntEnum):
+    INPUT = 0
+    OUTPUT = 1
+    ERROR = 2
+    CONTROL = 3
+
+
+# slots=True : pas de __dict__ par instance, les messages sont créés à chaque chunk audio/texte.
+# La construction d'un Message ne valide rien : les messages internes au pipeline sont
+# supposés corrects. Seules les données venant de l'extérieur passent par validate_ingress().
+@dataclass(slots=True)
 class Message:
     type: MessageType
     data: Any
     metadata: Optional[Dict] = None
 
+    # Sérialisation binaire : les bytes (audio) partent en "bin" msgpack, sans base64
+    def to_msgpack(self) -> bytes:
+        return dumps_msgpack(self.to_dict())
+
+    # Sérialisation texte pour les transports qui imposent du JSON (navigateur)
+    def to_json(self) -> bytes:
+        return self._encode_json()
+
+    def _encode_json(self) -> bytes:
+        return dumps_json(self.to_dict())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Forme sérialisée du message, commune à msgpack et JSON"""
+        metadata = self.metadata if self.metadata is not None else EMPTY_METADATA
+        return {"type": int(self.type), "data": self._wire_data(), "metadata": metadata}
+
+    def _wire_data(self) -> Any:
+        """Forme de data envoyée sur le fil (surchargée par les messages à data typée)"""
+        return self.data
+
+    @classmethod
+    def validate_ingress(cls, payload: Any) -> Dict:
+        """Vérifie un message décodé depuis une source non fiable (frame WebSocket...)"""
+        if not isinstance(payload, dict):
+            raise ValueError(f"Message invalide: dict attendu, reçu {type(payload).__name__}")
+        if "type" not in payload:
+            raise ValueError("Message invalide: champ 'type' manquant")
+        try:
+            MessageType(payload["type"])
+        except ValueError:
+            raise ValueError(f"Message invalide: type inconnu {payload['type']!r}")
+        metadata = payload.get("metadata")
+        if metadata is not None and not isinstance(metadata, dict):
+            raise ValueError(f"Message invalide: metadata doit être un dict, reçu {type(metadata).__name__}")
+        return payload
 
-@dataclass 
+    @classmethod
+    def from_msgpack(cls, buf: bytes) -> "Message":
+        payload = cls.validate_ingress(loads_msgpack(buf))
+        return Message(
+            type=MessageType(payload["type"]),
+            data=payload.get("data"),
+            metadata=payload.get("metadata")
+        )
+
+
+class MessagePacker:
+    """
+    Packer msgpack réutilisable, à garder un par connexion : ses buffers internes
+    sont conservés d'un message à l'autre. Non thread-safe.
+    """
+
+    def __init__(self):
+        self._packer = msgpack_packer()
+
+    def pack(self, message: Message) -> bytes:
+        return self._packer.pack(message.to_dict())
+
+
+# Sous-classes à constructeur spécifique : pas de @dataclass (il ne générerait
+# rien d'utile), juste __slots__ vide pour ne pas réintroduire de __dict__.
+# repr/eq restent ceux générés pour Message. Les attributs sont affectés
+# directement (pas d'appel à Message.__init__/__post_init__ par message).
 class InputMessage(Message):
+    __slots__ = ()
+
     def __init__(self, data: Any, metadata: Optional[Dict] = None):
-        super().__init__(MessageType.INPUT, data, metadata)
+        self.type = MessageType.INPUT
+        self.data = data
+        self.metadata = metadata
 
 
-@dataclass
 class OutputMessage(Message):
+    __slots__ = ()
+
     def __init__(self, result: Any, metadata: Optional[Dict] = None):
-        super().__init__(MessageType.OUTPUT, result, metadata)
+        self.type = MessageType.OUTPUT
+        self.data = result
+        self.metadata = metadata
 
 
-@dataclass
 class ErrorMessage(Message):
+    __slots__ = ()
+
     def __init__(self, error: str, step_name: str, metadata: Optional[Dict] = None):
-        data = {"error": error, "step_name": step_name}
-        super().__init__(MessageType.ERROR, data, metadata)
\ No newline at end of file
+        self.type = MessageType.ERROR
+        self.data = {"error": error, "step_name": step_name}
+        self.metadata = metadata
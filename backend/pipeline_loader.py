@@ -1,4 +1,3 @@
-import json
 import os
 import importlib
 from typing import Dict, List, Optional, Any
@@ -6,6 +5,7 @@ from pathlib import Path
 
 from pipeline_framework import Pipeline, PipelineStep
 from messages.base_message import InputMessage, OutputMessage
+from utils.codecs import loads_json
 
 
 class PipelineLoader:
@@ -49,11 +49,11 @@ class PipelineLoader:
             
         for json_file in self.step_definitions_dir.glob("*.json"):
             try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    step_def = json.load(f)
-                    step_type = step_def.get("name") or step_def.get("step_type")
-                    if step_type:
-                        self.step_definitions[step_type] = step_def
+                # Lu en bytes et décodé par orjson si disponible (pas de décodage texte préalable)
+                step_def = loads_json(json_file.read_bytes())
+                step_type = step_def.get("name") or step_def.get("step_type")
+                if step_type:
+                    self.step_definitions[step_type] = step_def
             except Exception as e:
                 pass
     
@@ -63,11 +63,10 @@ class PipelineLoader:
             
         for json_file in self.pipeline_definitions_dir.glob("*.json"):
             try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    pipeline_def = json.load(f)
-                    pipeline_id = pipeline_def.get("name") or pipeline_def.get("pipeline_id")
-                    if pipeline_id:
-                        self.pipeline_definitions[pipeline_id] = pipeline_def
+                pipeline_def = loads_json(json_file.read_bytes())
+                pipeline_id = pipeline_def.get("name") or pipeline_def.get("pipeline_id")
+                if pipeline_id:
+                    self.pipeline_definitions[pipeline_id] = pipeline_def
             except Exception as e:
                 pass
     
@@ -2,9 +2,10 @@ import time
 import urllib.parse
 import os
 import sys
+from array import array
 import logging
 import math
-import struct
+import threading
 from abc import abstractmethod
 from dataclasses import dataclass
 from enum import Enum
@@ -17,6 +18,8 @@ try:
     import websocket
     import msgpack
     MOSHI_DEPENDENCIES_AVAILABLE = True
+    # Décodeur lié une fois : on_message (12.5 messages/s) évite la résolution msgpack.unpackb
+    _unpackb = msgpack.unpackb
 except ImportError as e:
     print(f"""
     Missing dependencies for MoshiASR: {e}
@@ -25,6 +28,15 @@ except ImportError as e:
     MOSHI_DEPENDENCIES_AVAILABLE = False
     websocket = None
     msgpack = None
+    _unpackb = None
+
+# numpy optionnel : conversion PCM int16 -> float32 vectorisée (sinon boucle Python)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +48,13 @@ PAUSE_THRESHOLD = 0.9
 VAD_THRESHOLD = 0.8
 FLUSH_LENGTH = 12
 
+# Message "Ready" du serveur : forme fixe, reconnu par comparaison d'octets sans décodage
+# msgpack (clé encodée en str8 ou fixstr selon l'encodeur du serveur)
+_READY_FRAMES = frozenset((
+    b"\x81\xa4type\xa5Ready",
+    b"\x81\xd9\x04type\xd9\x05Ready",
+))
+
 
 class ExponentialMovingAverage:
     """Exponential Moving Average for pause prediction smoothing."""
@@ -67,11 +86,9 @@ class ASREvent:
     """Événement ASR standardisé pour input/output"""
     type: ASREventType
     data: Any = None
+    # Horodaté à l'émission (_enqueue_event) si non fourni : les événements
+    # ignorés ne coûtent pas de lecture d'horloge
     timestamp: Optional[float] = None
-    
-    def __post_init__(self):
-        if self.timestamp is None:
-            self.timestamp = time.time()
 
 
 @dataclass
@@ -83,7 +100,6 @@ class TextEvent(ASREvent):
     def __post_init__(self):
         if self.type is None:
             self.type = ASREventType.TEXT
-        super().__post_init__()
         self.data = self.text
 
 
@@ -96,7 +112,6 @@ class StartEvent(ASREvent):
     def __post_init__(self):
         if self.type is None:
             self.type = ASREventType.START
-        super().__post_init__()
         self.data = {"reason": self.reason}
 
 
@@ -109,7 +124,6 @@ class EndEvent(ASREvent):
     def __post_init__(self):
         if self.type is None:
             self.type = ASREventType.END
-        super().__post_init__()
         self.data = {"reason": self.reason}
 
 
@@ -119,11 +133,16 @@ class MoshiASR:
     """
 
     def __init__(self, host: str, **params):
+        if not MOSHI_DEPENDENCIES_AVAILABLE:
+            raise RuntimeError("MoshiASR nécessite websocket-client et msgpack (pip install websocket-client msgpack)")
+        
         self.host = host
         self.name = f"MoshiASR({self.host or 'auto'})"
 
         self.ws = None
         self._connected = False
+        # Signalé par on_open : connect() attend dessus au lieu de sonder _connected
+        self._connected_event = threading.Event()
         self._stream_active = False
         
         self.is_speaking = False
@@ -147,6 +166,29 @@ class MoshiASR:
         self.output_queue = None
         self.text_buffer = []
         self.current_client_id = None
+        
+        # Packer msgpack réutilisé pour tous les paquets audio. _send_audio est appelé depuis le
+        # thread du handler et depuis le thread WebSocket (silence du flushing) : le Packer n'étant
+        # pas thread-safe, pack + send sont faits sous verrou (ce qui garde aussi l'ordre des paquets)
+        self._packer = msgpack.Packer(use_bin_type=True, use_single_float=True, autoreset=True)
+        self._send_lock = threading.Lock()
+        # send_binary du socket sous-jacent, lié à l'ouverture : évite la couche
+        # WebSocketApp.send (et la résolution de l'opcode) à chaque paquet
+        self._ws_send_binary = None
+        
+        # Paquet de silence (flushing) pré-encodé : seul le timestamp varie d'un paquet à l'autre,
+        # le reste (clés, type, 1920 échantillons nuls) est encodé une seule fois.
+        # Même ordre de clés que le dict de _send_audio : type, timestamp, pcm
+        self._silence_prefix = (
+            self._packer.pack_map_header(3)
+            + self._packer.pack("type") + self._packer.pack("Audio")
+            + self._packer.pack("timestamp")
+        )
+        self._silence_suffix = self._packer.pack("pcm") + self._packer.pack([0.0] * SAMPLES_PER_FRAME)
+        
+        # URL et headers fixes après __init__ : calculés une fois, réutilisés à chaque (re)connexion
+        self._ws_url = self._build_websocket_url()
+        self._ws_headers = ["kyutai-api-key: public_token"]
 
         logger.debug(f"{self.name}: Initialized")
 
@@ -158,12 +200,12 @@ class MoshiASR:
         if self._connected:
             return
         
-        ws_url = self._build_websocket_url()
+        ws_url = self._ws_url
         logger.debug(f"{self.name}: Connecting to {ws_url}")
         
         self.ws = websocket.WebSocketApp(
             url=ws_url,
-            header=[f"kyutai-api-key: public_token"],
+            header=self._ws_headers,
             on_open=self.on_open,
             on_message=self.on_message,
             on_error=self.on_error,
@@ -172,17 +214,13 @@ class MoshiASR:
         
         def start_ws():
             import ssl
-            self.ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
+            # Le serveur n'envoie que des frames binaires (msgpack) : pas de validation UTF-8
+            self.ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE}, skip_utf8_validation=True)
         
-        import threading
         threading.Thread(target=start_ws, daemon=True).start()
         
         timeout = 10.0
-        start_time = time.time()
-        while not self._connected and (time.time() - start_time) < timeout:
-            time.sleep(0.1)
-            
-        if not self._connected:
+        if not self._connected_event.wait(timeout):
             raise RuntimeError(f"Failed to connect to {ws_url} within {timeout}s")
 
     def _build_websocket_url(self):
@@ -193,23 +231,30 @@ class MoshiASR:
 
     def on_open(self, ws):
         """WebSocket connection opened callback."""
+        self._ws_send_binary = ws.sock.send_binary
         self._connected = True
+        self._connected_event.set()
         logger.debug(f"{self.name}: WebSocket connected successfully")
 
     def on_message(self, ws, message):
         """WebSocket message received callback."""
         try:
-            message_dict = msgpack.unpackb(message)
-            
-            if message_dict.get("type") == "Ready":
+            if message in _READY_FRAMES:
                 self._stream_active = True
                 return
             
-            message_type = message_dict.get('type', 'unknown')
+            # use_list=False : les tableaux (prs...) sont décodés en tuples
+            message_dict = _unpackb(message, use_list=False, raw=False)
+            get = message_dict.get
+            
+            message_type = get('type', 'unknown')
+            if message_type == "Ready":
+                self._stream_active = True
+                return
 
             if message_type == 'Word':
-                word_text = message_dict.get('text', '')
-                start_time = message_dict.get('start_time', 0)
+                word_text = get('text', '')
+                start_time = get('start_time', 0)
                 if self.flushing_mode:
                     self.flushing_mode = False
                     logger.debug("Cancel flushing mode")
@@ -224,19 +269,19 @@ class MoshiASR:
                 self.last_word_time = start_time
                 self.is_speaking = True
                 
-                logger.debug(f"{self.name}: Word: '{word_text}' at {start_time:.2f}s")
+                logger.debug("%s: Word: '%s' at %.2fs", self.name, word_text, start_time)
                 
             elif message_type == 'EndWord':
-                stop_time = message_dict.get('stop_time', 0)
-                logger.debug(f"{self.name}: Word ended at {stop_time:.2f}s")
+                stop_time = get('stop_time', 0)
+                logger.debug("%s: Word ended at %.2fs", self.name, stop_time)
                 
             elif message_type == 'Marker':
-                marker_id = message_dict.get('id', 0)
-                logger.debug(f"{self.name}: Marker received: {marker_id}")
+                marker_id = get('id', 0)
+                logger.debug("%s: Marker received: %s", self.name, marker_id)
                 
             elif message_type == 'Step':
-                step_idx = message_dict.get('step_idx', 0)
-                prs = message_dict.get('prs', [])
+                step_idx = get('step_idx', 0)
+                prs = get('prs', ())
 
                 self.packets_received += 1
 
@@ -245,15 +290,16 @@ class MoshiASR:
                         self.steps_to_wait -= 1
                         return
                     
-                    self.pause_prediction.update(FRAME_TIME_SEC, prs[2])
+                    pause_prediction = self.pause_prediction
+                    pause_value = pause_prediction.update(FRAME_TIME_SEC, prs[2])
         
-                    if self.pause_prediction.value > self.pause_threshold and self.is_speaking:
+                    if pause_value > self.pause_threshold and self.is_speaking:
                         if not self.flushing_mode:
                             logger.debug("Starting flushing mode")
                             self._enter_flushing_mode()
                     
-                    elif self.pause_prediction.value < self.vad_threshold:
-                        self.pause_prediction.value = 0.0
+                    elif pause_value < self.vad_threshold:
+                        pause_prediction.value = 0.0
                         if self.flushing_mode:
                             logger.debug("Cancel flushing mode")
                             self.flushing_mode = False
@@ -274,46 +320,50 @@ class MoshiASR:
             logger.error(f"{self.name}: Error processing message: {e}")
 
     def _enqueue_event(self, event: ASREvent):
-        logger.debug(f"{self.name}: _enqueue_event called with type={event.type}")
-        if self.output_queue:
+        logger.debug("%s: _enqueue_event called with type=%s", self.name, event.type)
+        output_queue = self.output_queue
+        if output_queue:
+            event_type = event.type
+            client_id = self.current_client_id
             # Convertir ASREvent en OutputMessage pour le pipeline
-            if event.type == ASREventType.TEXT:
+            if event_type == ASREventType.TEXT:
                 # Ajouter le mot au buffer d'abord
                 self.text_buffer.append(event.text)
-                logger.debug(f"{self.name}: Added word '{event.text}' to buffer, buffer now: {self.text_buffer}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("%s: Added word '%s' to buffer, buffer now: %s", self.name, event.text, self.text_buffer)
                 
                 # Message transcript_chunk pour streaming
                 message = OutputMessage(
                     result=event.text,  # Utilise 'result' pas 'data'
                     metadata={
-                        "client_id": self.current_client_id,
+                        "client_id": client_id,
                         "transcription_type": "partial",
                         "message_type": "transcript_chunk",
-                        "timestamp": event.timestamp
+                        "timestamp": event.timestamp or time.time()
                     }
                 )
-                self.output_queue.enqueue(message)
-                logger.info(f"{self.name}: Sent transcript_chunk: '{event.text}' for client {self.current_client_id}")
+                output_queue.enqueue(message)
+                logger.debug("%s: Sent transcript_chunk: '%s' for client %s", self.name, event.text, client_id)
                 
-            elif event.type == ASREventType.END:
+            elif event_type == ASREventType.END:
                 # Message transcript_done pour LLM
                 full_text = ' '.join(self.text_buffer).strip()
-                logger.debug(f"{self.name}: Creating transcript_done from buffer: '{full_text}'")
+                logger.debug("%s: Creating transcript_done from buffer: '%s'", self.name, full_text)
                 message = OutputMessage(
                     result=full_text,  # Utilise 'result' pas 'data'
                     metadata={
-                        "client_id": self.current_client_id,
+                        "client_id": client_id,
                         "transcription_type": "complete",
                         "message_type": "transcript_done",
-                        "timestamp": event.timestamp
+                        "timestamp": event.timestamp or time.time()
                     }
                 )
-                self.output_queue.enqueue(message)
-                logger.info(f"{self.name}: Sent transcript_done: '{full_text}' for client {self.current_client_id}")
+                output_queue.enqueue(message)
+                logger.info("%s: Sent transcript_done: '%s' for client %s", self.name, full_text, client_id)
                 # Reset buffer after sending complete transcript
                 self.text_buffer = []
             else:
-                logger.debug(f"{self.name}: Ignoring event type {event.type}")
+                logger.debug("%s: Ignoring event type %s", self.name, event_type)
         else:
             logger.error(f"{self.name}: No output_queue to send event!")
 
@@ -324,6 +374,8 @@ class MoshiASR:
     def on_close(self, ws, close_status_code, close_msg):
         """WebSocket close callback."""
         self._connected = False
+        self._connected_event.clear()
+        self._ws_send_binary = None
         self._stream_active = False
         logger.debug(f"{self.name}: WebSocket disconnected")
 
@@ -338,23 +390,38 @@ class MoshiASR:
                 "pcm": audio_data if isinstance(audio_data, list) else list(audio_data)
             }
             
-            packed_message = msgpack.packb(message, use_bin_type=True, use_single_float=True)
-            self.ws.send(packed_message, opcode=websocket.ABNF.OPCODE_BINARY)
-            self.packets_sent += 1
+            with self._send_lock:
+                send_binary = self._ws_send_binary
+                if send_binary is None:
+                    return
+                send_binary(self._packer.pack(message))
+                self.packets_sent += 1
             
         except Exception as e:
             logger.error(f"{self.name}: Error sending packet to STT: {e}")
 
+    def _send_silence(self, timestamp: float):
+        """Send a pre-encoded silence packet (only the timestamp is packed)."""
+        if not self._connected or not self.ws:
+            return
+        with self._send_lock:
+            send_binary = self._ws_send_binary
+            if send_binary is None:
+                return
+            send_binary(self._silence_prefix + self._packer.pack(timestamp) + self._silence_suffix)
+            self.packets_sent += 1
+
     def _enter_flushing_mode(self):
         """Enter flushing mode and send silence packets."""
         self.flushing_mode = True
         
-        silence_samples = [0.0] * SAMPLES_PER_FRAME
         self.flushing_limit = self.packets_sent + self.silence_packets_count
+        # Une lecture d'horloge pour la salve, puis un pas de frame par paquet
+        base_timestamp = time.time()
         for i in range(self.silence_packets_count):
             try:
-                timestamp = time.time()
-                self._send_audio(silence_samples, timestamp)
+                timestamp = base_timestamp + i * FRAME_TIME_SEC
+                self._send_silence(timestamp)
             except Exception as e:
                 logger.error(f"{self.name}: Error sending silence packet {i}: {e}")
                 break
@@ -374,25 +441,39 @@ class MoshiASR:
             self.current_client_id = client_id
             
         try:
-            # Decode binary audio data using struct.unpack
             num_samples = len(audio_chunk) // 2  # 2 bytes per int16
-            audio_ints = struct.unpack(f'<{num_samples}h', audio_chunk)
-            
-            # Convert int16 to float32 and normalize
-            audio_float32 = [float(sample) / 32767.0 for sample in audio_ints]
+            if NUMPY_AVAILABLE:
+                # Décodage + normalisation en C, dans un seul tableau float32 ; chaque frame est
+                # une vue sur ce tableau, convertie directement en liste de float pour msgpack
+                # (pas de liste intermédiaire pour tout le chunk puis recopiée par tranche)
+                samples = np.frombuffer(audio_chunk, dtype='<i2', count=num_samples).astype(np.float32)
+                samples /= 32767.0
+                frames = [
+                    samples[i:i + SAMPLES_PER_FRAME].tolist()
+                    for i in range(0, num_samples, SAMPLES_PER_FRAME)
+                ]
+            else:
+                # Sans numpy : array('h') copie directement les int16 (pas de chaîne de format
+                # ni de tuple de N éléments comme struct.unpack), puis normalisation en Python
+                audio_ints = array('h')
+                audio_ints.frombytes(memoryview(audio_chunk)[:num_samples * 2])
+                if sys.byteorder == 'big':
+                    audio_ints.byteswap()  # le flux est en int16 little-endian
+                audio_float32 = [sample / 32767.0 for sample in audio_ints]
+                frames = [
+                    audio_float32[i:i + SAMPLES_PER_FRAME]
+                    for i in range(0, num_samples, SAMPLES_PER_FRAME)
+                ]
             
             base_timestamp = time.time()
-            packet_index = 0
+            send_audio = self._send_audio
             
-            for i in range(0, len(audio_float32), SAMPLES_PER_FRAME):
-                chunk = audio_float32[i:i + SAMPLES_PER_FRAME]
-                
+            for packet_index, chunk in enumerate(frames):
                 if len(chunk) < SAMPLES_PER_FRAME:
                     logger.warning(f"Audio packet should be multiple of {SAMPLES_PER_FRAME}")
                 
                 packet_timestamp = base_timestamp + (packet_index * FRAME_TIME_SEC)
-                self._send_audio(chunk, packet_timestamp)
-                packet_index += 1
+                send_audio(chunk, packet_timestamp)
             
         except Exception as e:
             logger.error(f"{self.name}: Error processing audio chunk: {e}")
@@ -412,6 +493,7 @@ class MoshiASR:
             logger.error(f"{self.name}: Disconnect error: {e}")
         finally:
             self._connected = False
+            self._connected_event.clear()
             self._stream_active = False
             self.flushing_mode = False
             self.packets_sent = 0
@@ -483,7 +565,10 @@ class KyutaiASRStep(PipelineStep):
     
     def _handle_input_message(self, message: Message):
         try:
-            logger.info(f"🎤 ASR: _handle_input_message called with type={message.type}")
+            # Appelé pour chaque chunk audio : traces en debug, formatées seulement si actif
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug("🎤 ASR: _handle_input_message called with type=%s", message.type)
             if message.type != MessageType.INPUT:
                 logger.warning(f"🎤 ASR: Type de message non supporté: {message.type}")
                 return
@@ -497,20 +582,23 @@ class KyutaiASRStep(PipelineStep):
             # Récupère l'ID du client pour le routage de retour
             if message.metadata:
                 self.current_client_id = message.metadata.get("client_id")
-                logger.info(f"🎤 ASR: Client ID: {self.current_client_id}")
+                if debug:
+                    logger.debug("🎤 ASR: Client ID: %s", self.current_client_id)
             
             # Vérifie que MoshiASR est initialisé
             if not self.moshi_asr:
                 logger.error("🎤 ASR: MoshiASR non initialisé")
                 return
             
-            logger.info(f"🎤 ASR: MoshiASR connecté: {self.moshi_asr._connected}, actif: {self.moshi_asr._stream_active}")
+            if debug:
+                logger.debug("🎤 ASR: MoshiASR connecté: %s, actif: %s", self.moshi_asr._connected, self.moshi_asr._stream_active)
             
             # Traite le chunk audio avec MoshiASR
             if isinstance(audio_data, bytes):
                 # Audio binaire brut - utilise la méthode interne de MoshiASR
                 self.moshi_asr._process_audio_chunk(audio_data, self.current_client_id)
-                logger.info(f"🎤 ASR: Chunk audio traité ({len(audio_data)} bytes) pour client {self.current_client_id}")
+                if debug:
+                    logger.debug("🎤 ASR: Chunk audio traité (%d bytes) pour client %s", len(audio_data), self.current_client_id)
             else:
                 logger.error(f"🎤 ASR: Format audio non supporté (attendu: bytes), reçu: {type(audio_data)}")
             
@@ -1,14 +1,17 @@
+import asyncio
 import time
 import threading
 import logging
 import os
 import json
-from typing import Optional, Dict, Any
-from dataclasses import dataclass
+from collections import OrderedDict, deque
+from typing import Any, ClassVar, Dict, Optional
+from dataclasses import dataclass, field
 from enum import Enum
 
 from pipeline_framework import PipelineStep
 from messages.base_message import Message, InputMessage, OutputMessage, ErrorMessage, MessageType
+from messages.asr_message import TranscriptionData
 
 try:
     import openai
@@ -23,6 +26,20 @@ except ImportError as e:
     openai = None
     dotenv = None
 
+# httpx est une dépendance d'openai ; HTTP/2 n'est activé que si h2 est installé (httpx[http2])
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,10 +50,14 @@ class LLMEventType(Enum):
     FINISH_RESPONSE = "finish_response"    # Final response completion
 
 
-@dataclass
+# slots=True : pas de __dict__ par événement. Le type d'événement est une constante de
+# classe (ClassVar), pas un champ d'instance. Les sous-classes appellent
+# LLMEvent.__post_init__ explicitement : le super() sans argument ne fonctionne pas
+# dans une classe recréée par dataclass(slots=True).
+@dataclass(slots=True)
 class LLMEvent:
     """Événement LLM standardisé pour input/output"""
-    type: LLMEventType
+    type: ClassVar[Optional[LLMEventType]] = None
     data: Any = None
     timestamp: Optional[float] = None
     
@@ -45,46 +66,53 @@ class LLMEvent:
             self.timestamp = time.time()
 
 
-@dataclass
+@dataclass(slots=True)
 class InputEvent(LLMEvent):
     """Événement input avec texte et outils"""
+    type: ClassVar[LLMEventType] = LLMEventType.INPUT
     text: str = ""
     tools: Optional[Dict] = None
-    type: LLMEventType = None
     
     def __post_init__(self):
-        if self.type is None:
-            self.type = LLMEventType.INPUT
-        super().__post_init__()
-        self.data = {
-            "text": self.text,
-            "tools": self.tools
-        }
+        LLMEvent.__post_init__(self)
+        # Tuple (texte, outils) plutôt qu'un dict par événement
+        self.data = (self.text, self.tools)
 
 
-@dataclass
+@dataclass(slots=True)
 class PartialResponseEvent(LLMEvent):
     """Événement de réponse partielle avec texte uniquement"""
+    type: ClassVar[LLMEventType] = LLMEventType.PARTIAL_RESPONSE
     text: str = ""
-    type: LLMEventType = None
     
     def __post_init__(self):
-        if self.type is None:
-            self.type = LLMEventType.PARTIAL_RESPONSE
-        super().__post_init__()
+        LLMEvent.__post_init__(self)
         self.data = self.text
 
 
-@dataclass
+@dataclass(slots=True)
 class FinishResponseEvent(LLMEvent):
     """Événement de fin de réponse sans contenu"""
-    type: LLMEventType = None
-    
-    def __post_init__(self):
-        if self.type is None:
-            self.type = LLMEventType.FINISH_RESPONSE
-        super().__post_init__()
-        self.data = None
+    type: ClassVar[LLMEventType] = LLMEventType.FINISH_RESPONSE
+
+
+# Nombre de messages d'historique envoyés au LLM (limite pour éviter des contextes trop longs)
+MAX_HISTORY = 10
+
+
+@dataclass
+class ClientState:
+    """État de conversation d'un client : chaque client a son historique et ses verrous"""
+    # Borné : seuls les MAX_HISTORY derniers messages sont gardés, les plus anciens sont évincés
+    history: deque = field(default_factory=lambda: deque(maxlen=MAX_HISTORY))
+    # Protège history contre les lectures depuis d'autres threads (stats, reset)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # Un tour (question -> réponse complète) à la fois par client, sur la boucle du step :
+    # la requête suivante attend l'ajout de la réponse précédente à l'historique
+    turn_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # Tours soumis et pas encore terminés (un client actif n'est jamais évincé)
+    active: int = 0
+    last_used: float = field(default_factory=time.monotonic)
 
 
 class OpenAIChatStep(PipelineStep):
@@ -113,18 +141,65 @@ class OpenAIChatStep(PipelineStep):
         self.model = config.get("model", "gpt-4o-mini") if config else "gpt-4o-mini"
         self.temperature = config.get("temperature", 0.7) if config else 0.7
         self.max_tokens = config.get("max_tokens", 1000) if config else 1000
+        
+        # Regroupement des chunks streamés : un OutputMessage part dès que le texte en attente
+        # atteint coalesce_chars caractères ou, au plus tard, coalesce_ms ms après le dernier
+        # envoi (timer, même sans nouveau delta) (coalesce_chars=0 : un message par chunk)
+        self.coalesce_chars = config.get("coalesce_chars", 32) if config else 32
+        self.coalesce_ms = config.get("coalesce_ms", 20) if config else 20
+        
+        # "sync" : la coroutine de streaming dépose directement dans l'output_queue (ChunkQueue).
+        # "async" : elle fait un put_nowait dans une asyncio.Queue de la boucle du step, et une
+        # tâche relais transfère les messages par lots vers l'output_queue depuis un thread de
+        # l'executor (ni verrou ni yield du scheduler dans la boucle de streaming)
+        self.output_queue_mode = config.get("output_queue_mode", "sync") if config else "sync"
+        self._async_output = None
+        self._forward_task = None
+        
+        # Nombre maximal de streams LLM simultanés (tous clients confondus) : les requêtes
+        # au-delà attendent un créneau sur la boucle du step
+        self.max_concurrent_streams = config.get("max_concurrent_streams", 16) if config else 16
+        self._stream_slots = asyncio.Semaphore(self.max_concurrent_streams)
+        # Futures des requêtes soumises à la boucle et pas encore terminées
+        self._inflight = set()
+        
+        # Paramètres d'appel fixes, construits une fois : seul "messages" change par requête
+        self._call_template = {
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": True
+        }
         self.system_prompt = config.get("system_prompt", "You are a helpful assistant.") if config else "You are a helpful assistant."
         
-        # État de conversation
-        self.conversation_history = []
+        # État de conversation, séparé par client_id : deux clients ne partagent
+        # ni historique ni verrou. Ordonné du moins au plus récemment utilisé : les
+        # clients inactifs depuis client_idle_ttl secondes, puis les plus anciens
+        # au-delà de max_clients, sont évincés (les ids client_N ne sont jamais réutilisés)
+        self._clients: "OrderedDict[Optional[str], ClientState]" = OrderedDict()
+        self.client_idle_ttl = config.get("client_idle_ttl", 1800) if config else 1800
+        self.max_clients = config.get("max_clients", 1000) if config else 1000
         self.accumulated_text = ""  # Pour accumuler le texte reçu en plusieurs fois
-        self.current_client_id = None
         
-        # Thread safety
-        self._lock = threading.Lock()
+        # Préfixe système (prompt + date/heure) réutilisé tant que la minute ne change pas
+        self._prefix_cache = None  # (minute, [message_système, message_heure])
+        
+        # Ne protège que le dictionnaire des clients et l'état global (system prompt)
+        self._clients_lock = threading.Lock()
+        
+        # Aiguillage des messages entrants par code de type (None = message ignoré,
+        # code absent = requête de chat). Les transcript_chunk sont ignorés :
+        # seul transcript_done déclenche une génération
+        self._dispatch = {
+            "system_prompt_update": self._on_system_prompt_update,
+            "transcript_chunk": None,
+            "transcript_done": self._on_transcript_done,
+        }
         
-        # Client OpenAI
+        # Client OpenAI (async) et sa boucle d'événements dédiée
         self.client = None
+        self._loop = None
+        self._loop_thread = None
         
         print(f"OpenAIChatStep '{self.name}' configuré avec modèle {self.model}")
     
@@ -139,24 +214,46 @@ class OpenAIChatStep(PipelineStep):
             provider = self.config.get("provider")  # Pas de défaut ici, défini dans le JSON
             endpoint = self.config.get("endpoint")
             
+            # Client HTTP partagé par toutes les requêtes du step : une seule poignée de
+            # main TLS, connexions gardées ouvertes et streams multiplexés en HTTP/2
+            http_client = None
+            if HTTPX_AVAILABLE:
+                http_client = httpx.AsyncClient(
+                    http2=HTTP2_AVAILABLE,
+                    timeout=httpx.Timeout(60.0, connect=5.0),
+                    limits=httpx.Limits(max_keepalive_connections=64, max_connections=128)
+                )
+            
             if provider == "llamacpp":
                 # Configuration Llama.cpp (Qwen3 VL 8B Instruct)
-                self.client = openai.OpenAI(
+                self.client = openai.AsyncOpenAI(
                     api_key=self.api_key,
-                    base_url=endpoint
+                    base_url=endpoint,
+                    http_client=http_client
                 )
                 print(f"Llama.cpp (Qwen3 VL 8B) initialisé - endpoint: {endpoint}, modèle: {self.model}")
             elif provider == "azure":
                 # Configuration Azure OpenAI
                 api_version = self.config.get("api_version")
-                self.client = openai.AzureOpenAI(
+                self.client = openai.AsyncAzureOpenAI(
                     api_key=self.api_key,
                     azure_endpoint=endpoint,
-                    api_version=api_version
+                    api_version=api_version,
+                    http_client=http_client
                 )
                 print(f"Azure OpenAI initialisé - endpoint: {endpoint}, modèle: {self.model}")
             else:
                 raise ValueError(f"Provider non supporté: {provider}")
+            
+            # Boucle asyncio dédiée : les appels réseau au LLM y tournent sans bloquer
+            # le thread du handler (et donc les autres clients)
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(target=self._run_loop, daemon=True)
+            self._loop_thread.start()
+            
+            if self.output_queue_mode == "async":
+                asyncio.run_coroutine_threadsafe(self._start_forwarder(), self._loop).result(timeout=2.0)
+            
             return True
             
         except Exception as e:
@@ -164,57 +261,132 @@ class OpenAIChatStep(PipelineStep):
             logger.error(f"OpenAI Chat init error: {e}")
             return False
     
+    def _run_loop(self):
+        """Fait tourner la boucle asyncio du step dans son thread"""
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+    
+    async def _start_forwarder(self):
+        self._async_output = asyncio.Queue()
+        self._forward_task = asyncio.get_running_loop().create_task(self._forward_output())
+    
+    async def _forward_output(self):
+        """Relaie l'asyncio.Queue vers l'output_queue, par lots, dans l'ordre d'arrivée"""
+        pending = self._async_output
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await pending.get()]
+            while not pending.empty():
+                batch.append(pending.get_nowait())
+            await loop.run_in_executor(None, self._enqueue_batch, batch)
+    
+    def _enqueue_batch(self, batch):
+        output_queue = self.output_queue
+        if output_queue:
+            for message in batch:
+                output_queue.enqueue(message)
+    
+    def _emit(self, message: OutputMessage):
+        """Envoie un message depuis la boucle du step (selon output_queue_mode)"""
+        if self._async_output is not None:
+            self._async_output.put_nowait(message)
+        elif self.output_queue:
+            self.output_queue.enqueue(message)
     
     def _handle_input_event(self, input_message):
         try:
-            with self._lock:
-                # Vérifier si c'est une mise à jour de system prompt
-                if (hasattr(input_message, 'metadata') and
-                    input_message.metadata and
-                    input_message.metadata.get('type') == 'system_prompt_update'):
-                    self._handle_system_prompt_update(input_message)
-                    return
-                
-                # FILTRER: Ignorer les transcript_chunk, ne traiter que transcript_done
-                if (hasattr(input_message, 'metadata') and
-                    input_message.metadata):
-                    message_type = input_message.metadata.get('message_type')
-                    if message_type == 'transcript_chunk':
-                        logger.debug(f"💬 Chat: Ignoring transcript_chunk (streaming), waiting for transcript_done")
-                        return
-                    elif message_type == 'transcript_done':
-                        logger.info(f"💬 Chat: Processing transcript_done - starting chat generation")
-                    
-                # Extraire le client_id des métadonnées du message entrant
-                if hasattr(input_message, 'metadata') and input_message.metadata:
-                    self.current_client_id = input_message.metadata.get('original_client_id') or input_message.metadata.get('client_id')
-                
-                # Extraire le contenu (texte + images éventuelles)
-                if hasattr(input_message, 'data'):
-                    if isinstance(input_message.data, dict):
-                        # Nouveau format avec support d'images
-                        text_data = input_message.data.get('text', '')
-                        images = input_message.data.get('images', [])
-                    else:
-                        # Format existant : texte simple
-                        text_data = str(input_message.data)
-                        images = []
-                elif hasattr(input_message, 'text'):
-                    text_data = input_message.text
-                    images = []
-                else:
-                    text_data = str(input_message)
-                    images = []
-                
-                logger.info(f"💬 Chat received input: '{text_data}' with {len(images)} images from client: {self.current_client_id}")
-                
-                # Traiter la requête avec texte et/ou images
-                if text_data.strip() or images:
-                    self._process_chat_request(text_data.strip(), images)
+            # Un seul lookup sur le code de type posé par le producteur
+            # (message_type pour l'ASR, type pour le system prompt)
+            metadata = getattr(input_message, 'metadata', None)
+            kind = (metadata.get('message_type') or metadata.get('type')) if metadata else None
+            handler = self._dispatch.get(kind, self._process_input)
+            if handler is not None:
+                handler(input_message, metadata)
         
         except Exception as e:
             logger.error(f"Erreur handling input event: {e}")
     
+    def _on_system_prompt_update(self, input_message, metadata):
+        with self._clients_lock:
+            self._handle_system_prompt_update(input_message)
+    
+    def _on_transcript_done(self, input_message, metadata):
+        logger.info(f"💬 Chat: Processing transcript_done - starting chat generation")
+        self._process_input(input_message, metadata)
+    
+    def _process_input(self, input_message, metadata):
+        """Extrait texte/images et client_id du message puis lance la requête de chat"""
+        # Extraire le client_id des métadonnées du message entrant
+        client_id = (metadata.get('original_client_id') or metadata.get('client_id')) if metadata else None
+        
+        # Extraire le contenu (texte + images éventuelles)
+        if hasattr(input_message, 'data'):
+            if isinstance(input_message.data, (dict, TranscriptionData)):
+                # Nouveau format avec support d'images
+                text_data = input_message.data.get('text', '')
+                images = input_message.data.get('images', [])
+            else:
+                # Format existant : texte simple
+                text_data = str(input_message.data)
+                images = []
+        elif hasattr(input_message, 'text'):
+            text_data = input_message.text
+            images = []
+        else:
+            text_data = str(input_message)
+            images = []
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"💬 Chat received input: '{text_data}' with {len(images)} images from client: {client_id}")
+        
+        # Traiter la requête avec texte et/ou images
+        if text_data.strip() or images:
+            self._process_chat_request(text_data.strip(), images, client_id)
+    
+    def _get_client_state(self, client_id: Optional[str]) -> ClientState:
+        """Retourne (en le créant si besoin) l'état de conversation du client, marqué
+        actif jusqu'au _release_client_state() de fin de tour"""
+        now = time.monotonic()
+        with self._clients_lock:
+            state = self._clients.get(client_id)
+            if state is None:
+                state = self._clients[client_id] = ClientState()
+            else:
+                self._clients.move_to_end(client_id)
+            state.active += 1
+            state.last_used = now
+            self._evict_clients(now)
+            return state
+    
+    def _release_client_state(self, client_id: Optional[str], state: ClientState):
+        """Fin de tour : le client redevient évinçable après client_idle_ttl"""
+        now = time.monotonic()
+        with self._clients_lock:
+            state.active -= 1
+            state.last_used = now
+            if self._clients.get(client_id) is state:
+                self._clients.move_to_end(client_id)
+            self._evict_clients(now)
+    
+    def _evict_clients(self, now: float):
+        """Évince les états inutilisés (appelé sous _clients_lock)"""
+        excess = len(self._clients) - self.max_clients
+        evicted = []
+        # Du moins au plus récemment utilisé : on s'arrête au premier client récent
+        # dès que le plafond est respecté
+        for client_id, state in self._clients.items():
+            if state.active:
+                continue
+            if excess > 0:
+                excess -= 1
+            elif now - state.last_used < self.client_idle_ttl:
+                break
+            evicted.append(client_id)
+        for client_id in evicted:
+            del self._clients[client_id]
+        if evicted:
+            logger.debug("💬 Chat: %d client(s) inactif(s) évincé(s)", len(evicted))
+    
     def _handle_system_prompt_update(self, input_message):
         """Traite les mises à jour de system prompt"""
         try:
@@ -228,12 +400,13 @@ class OpenAIChatStep(PipelineStep):
             
             # Mettre à jour le system prompt
             self.system_prompt = new_system_prompt
+            self._prefix_cache = None
             logger.info(f"System prompt mis à jour: {new_system_prompt[:100]}...")
             
         except Exception as e:
             logger.error(f"Erreur lors de la mise à jour du system prompt: {e}")
     
-    def _process_chat_request(self, text: str, images: list = None):
+    def _process_chat_request(self, text: str, images: list = None, client_id: Optional[str] = None):
         """Traite une requête de chat avec texte et images optionnelles"""
         if images is None:
             images = []
@@ -255,116 +428,182 @@ class OpenAIChatStep(PipelineStep):
                     })
                 
                 user_message["content"] = content
-                logger.info(f"💬 Prepared vision message: text='{text}', images={len(images)}")
+                logger.debug("💬 Prepared vision message: text='%s', images=%d", text, len(images))
             else:
                 # Message texte simple (format existant)
                 user_message["content"] = text
-                logger.info(f"💬 Prepared text message: '{text}'")
-            
-            self.conversation_history.append(user_message)
+                logger.debug("💬 Prepared text message: '%s'", text)
             
-            # Prépare les messages pour l'API
-            messages = self._prepare_messages()
+            state = self._get_client_state(client_id)
             
-            # Appel API OpenAI en streaming
-            self._call_openai_streaming(messages)
+            # Appel API OpenAI en streaming, soumis à la boucle du step : l'historique
+            # est mis à jour dans la coroutine, sous le verrou de tour du client
+            try:
+                future = asyncio.run_coroutine_threadsafe(
+                    self._call_openai_streaming(user_message, client_id, state), self._loop
+                )
+            except Exception:
+                self._release_client_state(client_id, state)
+                raise
+            self._inflight.add(future)
+            future.add_done_callback(self._inflight.discard)
             
         except Exception as e:
             logger.error(f"Erreur traitement requête chat: {e}")
-            self._send_error_response(str(e))
+            self._send_error_response(str(e), client_id)
     
-    def _prepare_messages(self):
-        """Prépare les messages pour l'API OpenAI"""
-        messages = []
-        
-        # Message système
-        if self.system_prompt:
-            messages.append({
+    def _prepare_messages(self, state: ClientState):
+        """Prépare les messages pour l'API OpenAI (appelé sous state.lock)"""
+        # Le préfixe ne dépend que du system prompt et de l'heure à la minute près :
+        # il n'est reconstruit qu'au changement de minute ou de prompt
+        minute = int(time.time() // 60)
+        cached = self._prefix_cache
+        if cached is None or cached[0] != minute:
+            prefix = []
+            
+            # Message système
+            if self.system_prompt:
+                prefix.append({
+                    "role": "system",
+                    "content": self.system_prompt
+                })
+            
+            # Ajoute l'heure actuelle
+            current_time = time.strftime("%A %d %B %Y %H:%M", time.localtime())
+            prefix.append({
                 "role": "system",
-                "content": self.system_prompt
+                "content": f"Current date and time: {current_time}"
             })
+            
+            cached = (minute, prefix)
+            self._prefix_cache = cached
         
-        # Ajoute l'heure actuelle
-        current_time = time.strftime("%A %d %B %Y %H:%M", time.localtime())
-        messages.append({
-            "role": "system",
-            "content": f"Current date and time: {current_time}"
-        })
-        
-        # Ajoute l'historique de conversation (limité aux N derniers messages)
-        max_history = 10  # Limite pour éviter des contextes trop longs
-        recent_history = self.conversation_history[-max_history:]
-        messages.extend(recent_history)
-        
+        # Ajoute l'historique de conversation (déjà limité aux MAX_HISTORY derniers messages)
+        messages = cached[1].copy()
+        messages.extend(state.history)
         return messages
     
-    def _call_openai_streaming(self, messages):
-        """Appel OpenAI en mode streaming"""
+    async def _call_openai_streaming(self, user_message, client_id, state: ClientState):
+        """Appel OpenAI en mode streaming (exécuté sur la boucle du step).
+        Les tours d'un même client sont sérialisés : ses chunks ne s'entrelacent pas et
+        l'historique reste question/réponse ; deux clients différents streament en parallèle,
+        dans la limite de max_concurrent_streams."""
+        # Verrou de tour avant le créneau : un tour en attente de son client n'occupe
+        # pas un créneau dont les autres clients ont besoin
+        try:
+            async with state.turn_lock:
+                async with self._stream_slots:
+                    await self._stream_turn(user_message, client_id, state)
+        finally:
+            self._release_client_state(client_id, state)
+    
+    async def _stream_turn(self, user_message, client_id, state: ClientState):
+        # Fragments de la réponse, joints une seule fois à la fin du stream
+        response_parts = []
+        chunk_count = 0
+        
+        # Metadata construite une fois par requête et partagée par tous les chunks :
+        # les steps en aval la lisent ou la copient, ils ne doivent pas la modifier
+        partial_metadata = {"original_client_id": client_id, "chunk_type": "partial"}
+        
+        emit = self._emit
+        # Évalué une fois par réponse : aucun formatage par chunk quand le debug est coupé
+        debug = logger.isEnabledFor(logging.DEBUG)
+        
+        # Texte pas encore envoyé = response_parts[pending_start:]. last_flush à 0 :
+        # le premier chunk part immédiatement (pas de latence ajoutée au premier token).
+        # Un timer sur la boucle du step envoie le texte en attente à l'échéance de
+        # coalesce_ms, même si le modèle marque une pause avant le delta suivant
+        coalesce_chars = self.coalesce_chars
+        coalesce_s = self.coalesce_ms / 1000.0
+        pending_start = 0
+        pending_chars = 0
+        last_flush = 0.0
+        flush_timer = None
+        loop = asyncio.get_running_loop()
+        
+        def flush():
+            nonlocal pending_start, pending_chars, last_flush, flush_timer
+            if flush_timer is not None:
+                flush_timer.cancel()
+                flush_timer = None
+            if pending_start < len(response_parts):
+                text = "".join(response_parts[pending_start:])
+                emit(OutputMessage(result=text, metadata=partial_metadata))
+            pending_start = len(response_parts)
+            pending_chars = 0
+            last_flush = time.monotonic()
+        
         try:
+            with state.lock:
+                state.history.append(user_message)
+                
+                # Prépare les messages pour l'API
+                messages = self._prepare_messages(state)
+            
             logger.info(f"💬 Calling OpenAI API with model {self.model}")
             logger.info(f"💬 Messages to send: {len(messages)} messages")
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                stream=True
+            response = await self.client.chat.completions.create(
+                **self._call_template, messages=messages
             )
             
             logger.info(f"💬 API response received, starting streaming...")
-            assistant_response = ""
-            chunk_count = 0
             
-            for chunk in response:
+            async for chunk in response:
                 chunk_count += 1
-                # Vérification de sécurité pour Azure OpenAI
-                if not hasattr(chunk, 'choices') or not chunk.choices:
+                # Vérification de sécurité pour Azure OpenAI (chunks sans choices)
+                choices = chunk.choices
+                if not choices:
                     continue
                     
-                choice = chunk.choices[0]
-                if hasattr(choice, 'delta') and choice.delta and choice.delta.content is not None:
-                    content = choice.delta.content
-                    assistant_response += content
-                    logger.info(f"OpenAI stream chunk: '{content[:50]}{'...' if len(content) > 50 else ''}'")
+                choice = choices[0]
+                delta = choice.delta
+                content = delta.content if delta is not None else None
+                if content:
+                    response_parts.append(content)
+                    if debug:
+                        logger.debug(f"OpenAI stream chunk: '{content[:50]}{'...' if len(content) > 50 else ''}'")
                     
-                    # Envoie directement vers l'output_queue
-                    if self.output_queue:
-                        output_message = OutputMessage(
-                            result=content,
-                            metadata={
-                                "original_client_id": self.current_client_id,
-                                "chunk_type": "partial",
-                                "timestamp": time.time()
-                            }
-                        )
-                        self.output_queue.enqueue(output_message)
+                    pending_chars += len(content)
+                    elapsed = time.monotonic() - last_flush
+                    if pending_chars >= coalesce_chars or elapsed >= coalesce_s:
+                        flush()
+                    elif flush_timer is None:
+                        flush_timer = loop.call_later(coalesce_s - elapsed, flush)
                 
                 # Vérifie si c'est la fin
-                if hasattr(choice, 'finish_reason') and choice.finish_reason == "stop":
+                if choice.finish_reason == "stop":
+                    flush()
+                    
                     # Ajoute la réponse complète à l'historique
-                    if assistant_response:
-                        self.conversation_history.append({
-                            "role": "assistant", 
-                            "content": assistant_response
-                        })
+                    if response_parts:
+                        with state.lock:
+                            state.history.append({
+                                "role": "assistant", 
+                                "content": "".join(response_parts)
+                            })
                     
                     # Envoie un marqueur de fin (optionnel)
-                    if self.output_queue:
-                        finish_message = OutputMessage(
-                            result="",
-                            metadata={
-                                "original_client_id": self.current_client_id,
-                                "chunk_type": "finish",
-                                "timestamp": time.time()
-                            }
-                        )
-                        self.output_queue.enqueue(finish_message)
+                    emit(OutputMessage(
+                        result="",
+                        metadata={"original_client_id": client_id, "chunk_type": "finish"}
+                    ))
                     break
+            else:
+                # Stream terminé sans "stop" (longueur max...) : envoie le texte en attente
+                flush()
             
         except Exception as e:
             logger.error(f"Erreur appel OpenAI: {e}")
-            self._send_error_response(str(e))
+            # Stream interrompu : le texte déjà reçu mais pas encore envoyé part avant l'erreur
+            if response_parts:
+                flush()
+            self._send_error_response(str(e), client_id)
+        finally:
+            # Stream terminé ou annulé : plus rien ne doit partir après coup
+            if flush_timer is not None:
+                flush_timer.cancel()
     
     def _handle_system_prompt_update(self, prompt_message):
         """Traite une mise à jour du system prompt"""
@@ -376,6 +615,7 @@ class OpenAIChatStep(PipelineStep):
             # Mettre à jour le system prompt
             old_prompt = self.system_prompt
             self.system_prompt = new_system_prompt
+            self._prefix_cache = None
             
             logger.info(f"System prompt mis à jour par {source} (ID: {prompt_id})")
             logger.debug(f"Ancien prompt: {old_prompt[:50]}...")
@@ -384,20 +624,20 @@ class OpenAIChatStep(PipelineStep):
             # Optionnel: réinitialiser l'historique de conversation pour un fresh start
             reset_history = prompt_message.metadata.get('reset_history', False)
             if reset_history:
-                self.conversation_history = []
+                self._clients = OrderedDict()
                 logger.info("Historique de conversation réinitialisé")
             
         except Exception as e:
             logger.error(f"Erreur mise à jour system prompt: {e}")
     
-    def _handle_response_streaming(self, response_event: LLMEvent):
+    def _handle_response_streaming(self, response_event: LLMEvent, client_id: Optional[str] = None):
         try:
             if response_event.type == LLMEventType.PARTIAL_RESPONSE:
                 logger.info(f"Handling partial response: '{response_event.data}'")
                 response_message = OutputMessage(
                     result=response_event.data,
                     metadata={
-                        "original_client_id": self.current_client_id,
+                        "original_client_id": client_id,
                         "response_type": "partial",
                         "timestamp": time.time()
                     }
@@ -410,7 +650,7 @@ class OpenAIChatStep(PipelineStep):
                 finish_message = OutputMessage(
                     result="",
                     metadata={
-                        "original_client_id": self.current_client_id,
+                        "original_client_id": client_id,
                         "response_type": "finish",
                         "timestamp": time.time()
                     }
@@ -429,25 +669,29 @@ class OpenAIChatStep(PipelineStep):
             except Exception as e:
                 logger.error(f"Erreur envoi message: {e}")
     
-    def _send_error_response(self, error_msg: str):
+    def _send_error_response(self, error_msg: str, client_id: Optional[str] = None):
         """Envoie une réponse d'erreur"""
         error_message = OutputMessage(
             result=f"Erreur: {error_msg}",
             metadata={
-                "original_client_id": self.current_client_id,
+                "original_client_id": client_id,
                 "response_type": "error",
                 "timestamp": time.time()
             }
         )
-        self._send_output_message(error_message)
+        # Depuis la boucle du step, l'erreur suit le chemin des partiels (_emit) : en mode
+        # async elle ne double pas ceux encore en attente dans la queue relais
+        if threading.current_thread() is self._loop_thread:
+            self._emit(error_message)
+        else:
+            self._send_output_message(error_message)
     
     def reset_conversation(self):
         """Remet à zéro la conversation"""
         try:
-            with self._lock:
-                self.conversation_history = []
+            with self._clients_lock:
+                self._clients = OrderedDict()
                 self.accumulated_text = ""
-                self.current_client_id = None
             
             logger.info("Conversation reset")
             
@@ -458,9 +702,10 @@ class OpenAIChatStep(PipelineStep):
         """Retourne les statistiques du chat"""
         stats = {
             "chat_active": self.client is not None,
-            "conversation_length": len(self.conversation_history),
+            "conversation_length": sum(len(state.history) for state in list(self._clients.values())),
             "accumulated_text": len(self.accumulated_text),
-            "current_client": self.current_client_id,
+            "active_clients": len(self._clients),
+            "inflight_requests": len(self._inflight),
             "model": self.model
         }
         
@@ -473,10 +718,25 @@ class OpenAIChatStep(PipelineStep):
         if hasattr(self, 'input_queue') and self.input_queue:
             self.input_queue.stop()
         
+        # Ferme le client (et le client HTTP partagé qu'il possède) puis arrête la boucle asyncio du step
+        if self._loop and self._loop.is_running():
+            try:
+                # Annule les requêtes encore en cours avant de fermer le client
+                for future in list(self._inflight):
+                    future.cancel()
+                if self._forward_task:
+                    self._loop.call_soon_threadsafe(self._forward_task.cancel)
+                if self.client:
+                    asyncio.run_coroutine_threadsafe(self.client.close(), self._loop).result(timeout=2.0)
+            except Exception as e:
+                logger.error(f"Erreur fermeture client OpenAI: {e}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._loop_thread and self._loop_thread.is_alive():
+            self._loop_thread.join(timeout=2.0)
+        
         # Nettoie l'état
-        with self._lock:
-            self.conversation_history = []
+        with self._clients_lock:
+            self._clients = OrderedDict()
             self.accumulated_text = ""
-            self.current_client_id = None
         
         print(f"OpenAI Chat {self.name} nettoyé")
\ No newline at end of file
@@ -30,6 +30,12 @@ class ChatterboxTTSStep(PipelineStep):
         self.stream_chunk_size = config.get("stream_chunk_size", [100]) if config else [100]
         self.response_format = config.get("response_format", "pcm") if config else "pcm"
         
+        # Regroupement des chunks audio reçus : un message part quand audio_batch_bytes octets
+        # sont en attente ou que audio_batch_ms ms se sont écoulées depuis le dernier envoi
+        # (audio_batch_bytes=0 : un message par chunk reçu)
+        self.audio_batch_bytes = config.get("audio_batch_bytes", 7680) if config else 7680
+        self.audio_batch_ms = config.get("audio_batch_ms", 20) if config else 20
+        
         self.headers = {
             "Content-Type": "application/json",
             "Accept": "audio/wav"
@@ -42,6 +48,11 @@ class ChatterboxTTSStep(PipelineStep):
         self.interrupted = False
         self._lock = threading.Lock()
         self._current_response = None
+        self._audio_metadata_template = {"type": "audio_chunk", "format": "pcm"}
+        self._audio_t0 = 0.0
+        self._audio_bytes_sent = 0
+        # Vrai jusqu'au premier chunk audio d'une phrase (en-tête WAV à retirer)
+        self._is_first_chunk = False
         
         
         # Accumulateur pour collecter le texte complet avant synthesis
@@ -128,7 +139,8 @@ class ChatterboxTTSStep(PipelineStep):
     
     def _synthesize_text(self, text: str):
         # Métriques de performance
-        start_time = time.time()
+        # Durées mesurées en monotonic (insensible aux sauts d'horloge)
+        start_time = time.monotonic()
         first_chunk_time = None
         total_audio_bytes = 0
         chunk_count = 0
@@ -138,6 +150,19 @@ class ChatterboxTTSStep(PipelineStep):
         
         self._is_first_chunk = True
         
+        # Timestamp des chunks audio = horloge murale lue une fois par phrase + position
+        # dans l'audio envoyé (PCM 24kHz 16-bit = 48000 octets/s), sans lecture d'horloge par chunk
+        self._audio_t0 = time.time()
+        self._audio_bytes_sent = 0
+        
+        # Metadata des chunks audio construite une fois par phrase : métadonnées client
+        # (original_client_id...) préservées, "type" forcé à "audio_chunk"
+        self._audio_metadata_template = {
+            "format": "pcm",
+            **(getattr(self, '_current_metadata', None) or {}),
+            "type": "audio_chunk"
+        }
+        
         payload = {
             "input": text,
             "response_format": self.response_format,
@@ -153,7 +178,7 @@ class ChatterboxTTSStep(PipelineStep):
         }
         
         try:
-            request_time = time.time()
+            request_time = time.monotonic()
             
             with requests.post(
                 self.host,
@@ -163,20 +188,28 @@ class ChatterboxTTSStep(PipelineStep):
                 stream=True,
                 verify=False
             ) as response:
-                response_time = time.time()
+                response_time = time.monotonic()
                 
                 with self._lock:
                     self._current_response = response
                 
                 if response.status_code == 200:
+                    # Audio pas encore envoyé ; last_flush à 0 : le premier chunk part tout de suite
+                    pending_audio = bytearray()
+                    last_flush = 0.0
+                    batch_s = self.audio_batch_ms / 1000.0
+                    batch_bytes = self.audio_batch_bytes
+                    send_audio_chunk = self._send_audio_chunk
+                    lock = self._lock
+                    
                     for chunk in response.iter_content(chunk_size=None):
-                        with self._lock:
+                        with lock:
                             if self.interrupted:
                                 break
                         
                         if chunk:
                             chunk_count += 1
-                            chunk_time = time.time()
+                            chunk_time = time.monotonic()
                             
                             # Time to First Token (TTFT)
                             if first_chunk_time is None:
@@ -185,11 +218,25 @@ class ChatterboxTTSStep(PipelineStep):
                                 print(f"🚀 TTFT: {ttft_ms:.1f}ms")
                             
                             total_audio_bytes += len(chunk)
-                            # Traitement direct du chunk audio (pas de queue intermédiaire)
-                            self._send_audio_chunk(chunk)
+                            flush_due = chunk_time - last_flush >= batch_s
+                            if not pending_audio and (flush_due or len(chunk) >= batch_bytes):
+                                # Rien en attente : le chunk reçu part tel quel, sans copie
+                                # dans pending_audio ni nouvel objet bytes
+                                send_audio_chunk(chunk)
+                                last_flush = chunk_time
+                                continue
+                            pending_audio += chunk
+                            if flush_due or len(pending_audio) >= batch_bytes:
+                                send_audio_chunk(bytes(pending_audio))
+                                pending_audio.clear()
+                                last_flush = chunk_time
+                    
+                    # Envoie l'audio restant (sauf interruption)
+                    if pending_audio and not self.interrupted:
+                        self._send_audio_chunk(bytes(pending_audio))
                     
                     # Calcul des métriques finales
-                    end_time = time.time()
+                    end_time = time.monotonic()
                     total_generation_time = end_time - start_time
                     
                     # Durée audio estimée (PCM 24kHz, 16-bit = 48000 bytes/sec)
@@ -215,25 +262,17 @@ class ChatterboxTTSStep(PipelineStep):
             return
         
         # Premier chunk - supprimer l'en-tête WAV
-        if hasattr(self, '_is_first_chunk') and self._is_first_chunk:
+        if self._is_first_chunk:
             self._is_first_chunk = False
             if len(chunk) > 44:
                 chunk = chunk[44:]
             else:
                 return
         
-        # Créer les métadonnées audio
-        audio_metadata = {
-            "type": "audio_chunk",
-            "format": "pcm",
-            "timestamp": time.time()
-        }
-        
-        # Préserver les métadonnées client (original_client_id, etc.)
-        if hasattr(self, '_current_metadata') and self._current_metadata:
-            audio_metadata.update(self._current_metadata)
-            # S'assurer que le type reste "audio_chunk"
-            audio_metadata["type"] = "audio_chunk"
+        # Métadonnées audio : copie du modèle de la phrase, seul le timestamp change
+        audio_metadata = self._audio_metadata_template.copy()
+        audio_metadata["timestamp"] = self._audio_t0 + self._audio_bytes_sent / 48000
+        self._audio_bytes_sent += len(chunk)
         
         # Créer et envoyer le message audio
         audio_message = OutputMessage(
@@ -1,18 +1,65 @@
 import asyncio
-import json
+import itertools
 import logging
 import threading
 import time
-import base64
 from typing import Optional, Dict, Any
 
 from pipeline_framework import PipelineStep
-from messages.base_message import Message, InputMessage, OutputMessage, ErrorMessage, MessageType
+from messages.base_message import EMPTY_METADATA, Message, InputMessage, OutputMessage, ErrorMessage, MessageType
 from utils.chunk_queue import ChunkQueue
+from utils.codecs import dumps_json, loads_json, dumps_msgpack, loads_msgpack, b64decode, b64encode
+
+# uvloop optionnel : boucle libuv pour le serveur WebSocket (sinon boucle asyncio standard)
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    uvloop = None
+    UVLOOP_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
 
+def _to_json_text(payload: Any) -> str:
+    """JSON (orjson si disponible) sous forme de str, pour l'imbriquer dans un autre message"""
+    return dumps_json(payload).decode()
+
+
+# Sous-protocoles négociés à la connexion. "msgpack" : frames binaires msgpack, l'audio y
+# circule en bin (sans base64). Sans sous-protocole (ou "json") : JSON en frames texte.
+SUBPROTOCOL_MSGPACK = "msgpack"
+SUBPROTOCOLS = [SUBPROTOCOL_MSGPACK, "json"]
+
+
+def _select_subprotocol(connection, offered):
+    """Choisit le premier sous-protocole proposé par le client qu'on supporte, sinon aucun
+    (les clients sans sous-protocole restent acceptés, en JSON)"""
+    for protocol in offered:
+        if protocol in SUBPROTOCOLS:
+            return protocol
+    return None
+
+
+def _encode_for(websocket, payload: Dict) -> bytes:
+    """Encode un message selon le sous-protocole de la connexion (bytes dans payload :
+    bin en msgpack, base64 en JSON)"""
+    if websocket.subprotocol == SUBPROTOCOL_MSGPACK:
+        return dumps_msgpack(payload)
+    return dumps_json(payload)
+
+
+def _audio_json_frame(prefix: bytes, audio_data: bytes) -> bytes:
+    """Complète une frame audio_chunk : audio en base64 et timestamp d'envoi"""
+    return b"".join((prefix, b64encode(audio_data), b'","timestamp":', repr(time.time()).encode(), b"}"))
+
+
+def _is_text(websocket) -> bool:
+    """Les frames sont toujours des bytes déjà encodés : le JSON (UTF-8) part en frame texte
+    via send(..., text=True), sans conversion str -> bytes par websockets ; msgpack en binaire"""
+    return websocket.subprotocol != SUBPROTOCOL_MSGPACK
+
+
 class WebSocketStep(PipelineStep):
     
     def __init__(self, name: str = "WebSocketServer", config: Optional[Dict] = None):
@@ -22,15 +69,48 @@ class WebSocketStep(PipelineStep):
         self.port = config.get("port", 8765) if config else 8765
         
         self.websocket_server = None
-        self.event_loop = None
+        self._reaper_task = None
+        # Boucle du serveur, créée ici pour que l'input_queue y exécute son handler : envois et
+        # réceptions WebSocket sur une seule boucle (les connexions ne sont pas thread-safe).
+        # uvloop si disponible, sans changer la policy globale (les autres steps gardent
+        # leur boucle asyncio standard)
+        self.event_loop = uvloop.new_event_loop() if UVLOOP_AVAILABLE else asyncio.new_event_loop()
         self.server_thread = None
         self.running = False
+        # Signalé par le thread serveur quand le démarrage est terminé (réussi ou non)
+        self._server_ready = threading.Event()
         
         self.connections = {}
+        # Copie figée de connections.items(), reconstruite seulement à la connexion/déconnexion
+        # d'un client : les diffusions l'itèrent sans recopier le dict à chaque message
+        self._connections_snapshot = ()
+        # Identifiants clients uniques sur la vie du step (id() d'un socket fermé peut être
+        # réattribué à une nouvelle connexion, qui recevrait alors les réponses de l'ancienne)
+        self._client_ids = itertools.count(1)
+        # Par client JSON : (metadata audio hors timestamp, début de frame JSON pré-encodé).
+        # La metadata des chunks d'une même phrase TTS ne diffère que par son timestamp
+        self._audio_json_prefixes = {}
+        # Au-delà de cette taille, le base64 + JSON d'un chunk audio est fait dans un thread
+        # (pybase64/orjson libèrent le GIL) pour ne pas bloquer la boucle des autres clients
+        self.audio_offload_bytes = config.get("audio_offload_bytes", 65536) if config else 65536
+        
+        # permessage-deflate : fenêtre zlib complète (15 bits) conservée d'un message à l'autre,
+        # les clés JSON et en-têtes répétés d'un chunk à l'autre sont compressés par référence.
+        # compression_level=None désactive la compression
+        self.compression_level = config.get("compression_level", 3) if config else 3
         
         self.audio_format = config.get("audio_format", "pcm16") if config else "pcm16"
         self.sample_rate = config.get("sample_rate", 24000) if config else 24000
         
+        # Regroupement des chunks audio sortants d'un même client en une seule frame, tant que
+        # d'autres messages attendent dans la queue (aucun délai ajouté quand elle est vide)
+        # et jusqu'à audio_batch_bytes octets (0 : une frame par chunk)
+        self.audio_batch_bytes = config.get("audio_batch_bytes", 16384) if config else 16384
+        self._audio_batch_client = None
+        self._audio_batch_metadata = None
+        self._audio_batch_chunks = []
+        self._audio_batch_size = 0
+        
         # Mode de fonctionnement : "audio_to_text" ou "text_to_audio"
         self.mode = config.get("mode", "audio_to_text") if config else "audio_to_text"
         
@@ -38,70 +118,107 @@ class WebSocketStep(PipelineStep):
         self.pipeline_capabilities = config.get("pipeline_capabilities", {}) if config else {}
         self.pipeline_name = config.get("pipeline_name", "Unknown Pipeline") if config else "Unknown Pipeline"
         
+        # Routage des messages sortants selon metadata["type"] (voir _handle_input_message_async)
+        self._output_dispatch = {
+            "audio_chunk": self._send_audio_chunk_message,
+            "audio_finished": self._send_audio_finished_message,
+            "chat_finished": self._send_chat_finished_message,
+        }
+        
         # Chaque step ne crée que son input_queue avec handler ASYNC
         # output_queue sera définie par le pipeline builder (= input_queue du step suivant)
-        self.input_queue = ChunkQueue(handler=self._handle_input_message_async)
+        self.input_queue = ChunkQueue(handler=self._handle_input_message_async, loop=self.event_loop)
     
     def init(self) -> bool:
         """Démarre le serveur WebSocket dans un thread séparé"""
         try:
+            self._build_connection_templates()
             self.running = True
             self.server_thread = threading.Thread(target=self._run_server, daemon=True)
             self.server_thread.start()
             
             # Attendre que le serveur soit prêt (maximum 5 secondes)
-            for i in range(50):
-                if self.websocket_server is not None:
-                    return True
-                time.sleep(0.1)
-            
-            return False
+            self._server_ready.wait(timeout=5.0)
+            return self.websocket_server is not None
             
         except Exception as e:
             return False
     
+    def _build_connection_templates(self):
+        """Pré-encode la partie fixe du message connection_established (JSON et msgpack) :
+        par connexion, seuls client_id et timestamp sont encodés puis concaténés"""
+        static = {
+            "type": "connection_established",
+            "pipeline": self.pipeline_name,
+            "mode": self.mode,
+            "capabilities": self.pipeline_capabilities,
+            "server_info": {
+                "host": self.host,
+                "port": self.port,
+                "audio_format": self.audio_format,
+                "sample_rate": self.sample_rate
+            }
+        }
+        # JSON : objet statique sans son "}" final, complété par les deux champs dynamiques
+        self._connection_json_prefix = dumps_json(static)[:-1]
+        # msgpack : map statique dont l'en-tête fixmap (0x80 | taille, moins de 16 entrées)
+        # est réécrit pour annoncer les 2 paires ajoutées à la suite
+        packed = dumps_msgpack(static)
+        self._connection_msgpack_prefix = bytes([0x80 | (len(static) + 2)]) + packed[1:]
+    
+    def _connection_message(self, websocket, client_id: str):
+        """Message connection_established encodé selon le sous-protocole de la connexion"""
+        timestamp = time.time()
+        if websocket.subprotocol == SUBPROTOCOL_MSGPACK:
+            return (self._connection_msgpack_prefix
+                    + dumps_msgpack("client_id") + dumps_msgpack(client_id)
+                    + dumps_msgpack("timestamp") + dumps_msgpack(timestamp))
+        return (self._connection_json_prefix
+                + b',"client_id":' + dumps_json(client_id)
+                + b',"timestamp":' + repr(timestamp).encode() + b"}")
+    
     def _run_server(self):
         """Lance le serveur WebSocket dans sa propre boucle d'événements"""
-        self.event_loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.event_loop)
         
         try:
             self.event_loop.run_until_complete(self.start_server())
+            self._server_ready.set()
             self.event_loop.run_forever()
         except Exception as e:
-            pass
+            # Échec du démarrage : init() n'attend pas la fin du délai
+            self._server_ready.set()
         finally:
             self.event_loop.close()
     
     async def _handle_input_message_async(self, message_data):
         """Handler ASYNC pour traiter les réponses du ChatStep - ChunkQueue gère la boucle !"""
         try:
-            logger.info(f"WebSocket received message from ChatStep: type={type(message_data).__name__}")
+            logger.info("WebSocket received message from ChatStep: type=%s", type(message_data).__name__)
+            
+            # Tout message autre que la suite de l'audio en attente le fait partir avant lui
+            if self._audio_batch_client is not None and not self._continues_audio_batch(message_data):
+                await self._flush_audio_batch()
             
             # Gestion spéciale pour les messages de contrôle (comme audio_finished)
             if isinstance(message_data, dict) and message_data.get('type') == 'audio_finished':
                 # Message de fin d'audio - le routage se fait via le duplicateur
-                logger.info(f"Sending audio_finished signal to all connected clients")
-                finish_message = json.dumps({
+                logger.info("Sending audio_finished signal to all connected clients")
+                finish_message = {
                     "type": "audio_finished",
                     "total_chunks": message_data.get('total_chunks', 0),
                     "total_bytes": message_data.get('total_bytes', 0),
                     "duration_seconds": message_data.get('duration_seconds', 0),
                     "timestamp": time.time()
-                })
+                }
                 # Envoyer à tous les clients connectés
-                for client_id in list(self.connections.keys()):
-                    try:
-                        websocket = self.connections[client_id]
-                        await websocket.send(finish_message)
-                        logger.info(f"✅ Sent audio_finished to {client_id}")
-                    except Exception as e:
-                        logger.error(f"❌ Failed to send audio_finished to {client_id}: {e}")
+                sent_count = self._broadcast(finish_message)
+                logger.info("✅ Sent audio_finished to %d clients", sent_count)
                 return
             
             if hasattr(message_data, 'data'):
                 data = message_data.data
-                metadata = getattr(message_data, 'metadata', {})
+                metadata = getattr(message_data, 'metadata', None) or EMPTY_METADATA
                 
                 # Extraire le client_id original de la métadonnée
                 original_client_id = metadata.get('original_client_id')
@@ -110,60 +227,10 @@ class WebSocketStep(PipelineStep):
                     logger.warning(f"No original_client_id in metadata, cannot route response: {metadata}")
                     return
                 
-                # Différencier texte vs audio selon le type de données et metadata
-                message_type = metadata.get('type', 'unknown')
-                
-                if message_type == 'audio_chunk' and isinstance(data, bytes):
-                    # Message audio - envoyer comme JSON avec base64
-                    logger.info(f"Sending audio chunk to client {original_client_id}: {len(data)} bytes")
-                    await self.send_audio_to_client(original_client_id, data, metadata)
-                    
-                elif message_type == 'audio_finished' or (isinstance(data, dict) and data.get('type') == 'audio_finished'):
-                    # Signal de fin de streaming audio
-                    logger.info(f"Sending audio finished signal to client {original_client_id}")
-                    finish_message = {
-                        "type": "audio_finished",
-                        "total_chunks": data.get('total_chunks', 0) if isinstance(data, dict) else 0,
-                        "total_bytes": data.get('total_bytes', 0) if isinstance(data, dict) else 0,
-                        "timestamp": time.time(),
-                        "metadata": metadata
-                    }
-                    await self.send_to_specific_client(original_client_id, json.dumps(finish_message), metadata)
-                    
-                elif message_type == 'chat_finished':
-                    # 🎯 Signal de fin de chat complet (TTS a terminé)
-                    logger.info(f"Sending chat finished signal to client {original_client_id}")
-                    chat_finish_message = {
-                        "type": "chat_finished",
-                        "timestamp": time.time(),
-                        "metadata": metadata
-                    }
-                    await self.send_to_specific_client(original_client_id, json.dumps(chat_finish_message), metadata)
-                    
-                elif isinstance(data, str) and data.strip().startswith('{"type": "audio_finished"'):
-                    # Signal de fin audio sérialisé - parser et traiter
-                    try:
-                        finish_data = json.loads(data)
-                        if finish_data.get('type') == 'audio_finished':
-                            logger.info(f"Sending parsed audio finished signal to client {original_client_id}")
-                            await self.send_to_specific_client(original_client_id, data, metadata)
-                            return
-                    except json.JSONDecodeError:
-                        pass  # Continuer comme texte normal
-                    
-                    # Si parsing échoue, traiter comme texte normal
-                    logger.info(f"Sending chat response to client {original_client_id}: '{str(data)[:50]}{'...' if len(str(data)) > 50 else ''}'")
-                    await self.send_to_specific_client(original_client_id, str(data), metadata)
-                    
-                elif isinstance(data, (str, int, float)):
-                    # Message texte normal - envoyer comme chat_response
-                    logger.info(f"Sending chat response to client {original_client_id}: '{str(data)[:50]}{'...' if len(str(data)) > 50 else ''}'")
-                    await self.send_to_specific_client(original_client_id, str(data), metadata)
-                    
-                else:
-                    # Données inconnues - convertir en string par défaut
-                    logger.warning(f"Unknown data type for client {original_client_id}: {type(data)}")
-                    await self.send_to_specific_client(original_client_id, str(data), metadata)
+                # Routage selon metadata["type"] ; le reste (texte, signaux sérialisés,
+                # données inconnues) passe par _send_data_message
+                handler = self._output_dispatch.get(metadata.get('type'), self._send_data_message)
+                await handler(original_client_id, data, metadata)
                 
             else:
                 logger.warning(f"Received message without data attribute: {message_data}")
@@ -173,6 +240,87 @@ class WebSocketStep(PipelineStep):
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
     
+    async def _send_audio_chunk_message(self, client_id: str, data: Any, metadata: dict):
+        if not isinstance(data, bytes):
+            await self._send_data_message(client_id, data, metadata)
+            return
+        # Message audio - regroupé puis envoyé (bin msgpack ou JSON base64)
+        logger.info("Sending audio chunk to client %s: %d bytes", client_id, len(data))
+        await self._batch_audio(client_id, data, metadata)
+    
+    async def _send_audio_finished_message(self, client_id: str, data: Any, metadata: dict):
+        # Signal de fin de streaming audio
+        logger.info("Sending audio finished signal to client %s", client_id)
+        finish_message = {
+            "type": "audio_finished",
+            "total_chunks": data.get('total_chunks', 0) if isinstance(data, dict) else 0,
+            "total_bytes": data.get('total_bytes', 0) if isinstance(data, dict) else 0,
+            "timestamp": time.time(),
+            "metadata": metadata
+        }
+        await self.send_to_specific_client(client_id, _to_json_text(finish_message), metadata)
+    
+    async def _send_chat_finished_message(self, client_id: str, data: Any, metadata: dict):
+        # 🎯 Signal de fin de chat complet (TTS a terminé)
+        logger.info("Sending chat finished signal to client %s", client_id)
+        chat_finish_message = {
+            "type": "chat_finished",
+            "timestamp": time.time(),
+            "metadata": metadata
+        }
+        await self.send_to_specific_client(client_id, _to_json_text(chat_finish_message), metadata)
+    
+    async def _send_data_message(self, client_id: str, data: Any, metadata: dict):
+        """Messages sans type dédié : texte du chat/ASR, signal de fin porté par data.
+        Les signaux de fin sont reconnus par metadata["type"] (voir _output_dispatch),
+        le texte n'est pas inspecté"""
+        if isinstance(data, dict) and data.get('type') == 'audio_finished':
+            await self._send_audio_finished_message(client_id, data, metadata)
+            
+        elif isinstance(data, (str, int, float)):
+            # Message texte normal - envoyer comme chat_response
+            logger.info("Sending chat response to client %s: '%.50s'", client_id, data)
+            await self.send_to_specific_client(client_id, str(data), metadata)
+            
+        else:
+            # Données inconnues - convertir en string par défaut
+            logger.warning(f"Unknown data type for client {client_id}: {type(data)}")
+            await self.send_to_specific_client(client_id, str(data), metadata)
+    
+    def _continues_audio_batch(self, message_data) -> bool:
+        metadata = getattr(message_data, 'metadata', None)
+        return (metadata is not None
+                and metadata.get('type') == 'audio_chunk'
+                and metadata.get('original_client_id') == self._audio_batch_client
+                and isinstance(getattr(message_data, 'data', None), bytes))
+    
+    async def _batch_audio(self, client_id: str, audio_data: bytes, metadata: dict):
+        """Ajoute un chunk audio au lot du client ; envoie le lot s'il est plein ou si
+        plus rien n'attend dans la queue"""
+        if self._audio_batch_client is None:
+            self._audio_batch_client = client_id
+            # Metadata (timestamp...) du premier chunk du lot
+            self._audio_batch_metadata = metadata
+        self._audio_batch_chunks.append(audio_data)
+        self._audio_batch_size += len(audio_data)
+        
+        if self._audio_batch_size >= self.audio_batch_bytes or self.input_queue.empty():
+            await self._flush_audio_batch()
+    
+    async def _flush_audio_batch(self):
+        client_id = self._audio_batch_client
+        if client_id is None:
+            return
+        chunks = self._audio_batch_chunks
+        metadata = self._audio_batch_metadata
+        self._audio_batch_client = None
+        self._audio_batch_metadata = None
+        self._audio_batch_chunks = []
+        self._audio_batch_size = 0
+        
+        audio_data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+        await self.send_audio_to_client(client_id, audio_data, metadata)
+    
     def cleanup(self):
         self.running = False
         
@@ -186,65 +334,43 @@ class WebSocketStep(PipelineStep):
             self.server_thread.join(timeout=2.0)
     
     async def websocket_handler(self, websocket):
-        client_id = f"client_{id(websocket)}"
-        self.connections[client_id] = websocket
+        client_id = f"client_{next(self._client_ids)}"
+        self._add_connection(client_id, websocket)
         
         try:
             logger.info(f"WebSocket handler started for client {client_id}, mode={self.mode}")
             
             # Envoyer le message de connexion établie avec les capacités du pipeline
-            connection_message = {
-                "type": "connection_established",
-                "client_id": client_id,
-                "pipeline": self.pipeline_name,
-                "mode": self.mode,
-                "capabilities": self.pipeline_capabilities,
-                "server_info": {
-                    "host": self.host,
-                    "port": self.port,
-                    "audio_format": self.audio_format,
-                    "sample_rate": self.sample_rate
-                },
-                "timestamp": time.time()
-            }
-            await websocket.send(json.dumps(connection_message))
+            await websocket.send(self._connection_message(websocket, client_id), text=_is_text(websocket))
+            msgpack_client = websocket.subprotocol == SUBPROTOCOL_MSGPACK
             
             async for message in websocket:
-                logger.info(f"Received message from {client_id}: type={type(message).__name__}, length={len(str(message)) if isinstance(message, str) else len(message) if isinstance(message, bytes) else 'unknown'}")
+                logger.info("Received message from %s: type=%s, length=%d", client_id, type(message).__name__, len(message))
                 
-                if self.mode in ["audio_to_text", "audio_text_to_text_audio"] and isinstance(message, str):
+                if msgpack_client and isinstance(message, bytes):
+                    # Client msgpack : frames binaires structurées, audio en bin (pas de base64)
+                    self._handle_msgpack_message(client_id, message)
+                    
+                elif self.mode in ["audio_to_text", "audio_text_to_text_audio"] and isinstance(message, str):
                     # Mode audio : traiter les messages JSON avec audio encodé
                     try:
-                        data = json.loads(message)
+                        data = loads_json(message)
                         if data.get("type") == "audio" and "data" in data:
                             # Décoder l'audio base64
                             audio_b64 = data["data"]
-                            audio_bytes = base64.b64decode(audio_b64)
-                            metadata = data.get("metadata", {})
+                            audio_bytes = b64decode(audio_b64)
                             
-                            logger.info(f"Processing JSON audio message from {client_id}: {len(audio_bytes)} bytes")
-                            audio_message = InputMessage(
-                                data=audio_bytes,
-                                metadata={
-                                    "client_id": client_id,
-                                    "format": metadata.get("format", self.audio_format),
-                                    "sample_rate": metadata.get("sample_rate", self.sample_rate),
-                                    "channels": metadata.get("channels", 1),
-                                    "chunk_index": metadata.get("chunk_index", 0),
-                                    "timestamp": time.time()
-                                }
-                            )
-                            self.output_queue.enqueue(audio_message)
-                            logger.info(f"Audio message queued for processing")
+                            logger.info("Processing JSON audio message from %s: %d bytes", client_id, len(audio_bytes))
+                            self._enqueue_client_audio(client_id, audio_bytes, data.get("metadata", {}))
                         else:
                             logger.warning(f"Unknown JSON message format from {client_id}: {message[:200]}...")
-                    except json.JSONDecodeError:
+                    except ValueError:
                         logger.error(f"Invalid JSON from {client_id}: {message[:200]}...")
                     except Exception as e:
                         logger.error(f"Error processing audio JSON from {client_id}: {e}")
                         
                 elif self.mode == "audio_to_text" and isinstance(message, bytes):
-                    logger.info(f"Processing raw audio message from {client_id}: {len(message)} bytes")
+                    logger.info("Processing raw audio message from %s: %d bytes", client_id, len(message))
                     audio_message = InputMessage(
                         data=message,
                         metadata={
@@ -255,12 +381,20 @@ class WebSocketStep(PipelineStep):
                         }
                     )
                     self.output_queue.enqueue(audio_message)
-                    logger.info(f"Audio message queued for processing")
+                    logger.info("Audio message queued for processing")
                     
                 elif (self.mode in ["text_to_audio", "text_to_text", "audio_text_to_text_audio"]) and isinstance(message, str):
-                    logger.info(f"Processing text message from {client_id}: '{message[:100]}{'...' if len(message) > 100 else ''}'")
-                    try:
-                        data = json.loads(message)
+                    logger.info("Processing text message from %s: '%.100s'", client_id, message)
+                    # Seul un objet JSON est un message structuré : le texte brut (cas courant)
+                    # n'est même pas passé au décodeur JSON, sans exception levée puis rattrapée
+                    data = None
+                    if message.lstrip()[:1] == "{":
+                        try:
+                            data = loads_json(message)
+                        except ValueError:
+                            data = None
+                    
+                    if isinstance(data, dict):
                         # Ne pas traiter les messages audio en mode texte
                         if data.get("type") == "audio":
                             continue
@@ -274,11 +408,11 @@ class WebSocketStep(PipelineStep):
                         if image:
                             images = [image]
                         
-                        logger.info(f"Parsed JSON message - text: '{text_data}', images: {len(images)}")
-                    except:
+                        logger.info("Parsed JSON message - text: '%s', images: %d", text_data, len(images))
+                    else:
                         text_data = message
                         images = []
-                        logger.info(f"Using raw text message: '{text_data}'")
+                        logger.info("Using raw text message: '%s'", text_data)
                     
                     text_message = InputMessage(
                         data={
@@ -293,22 +427,109 @@ class WebSocketStep(PipelineStep):
                         }
                     )
                     self.output_queue.enqueue(text_message)
-                    logger.info(f"Message queued - text: '{text_data}', images: {len(images)}")
+                    logger.info("Message queued - text: '%s', images: %d", text_data, len(images))
                     
         except Exception as e:
             logger.error(f"Error in websocket_handler for {client_id}: {e}")
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
         finally:
-            if client_id in self.connections:
-                del self.connections[client_id]
+            self._remove_connection(client_id)
+    
+    def _enqueue_client_audio(self, client_id: str, audio_bytes: bytes, metadata: dict):
+        """Transmet un chunk audio reçu d'un client (JSON base64 ou msgpack bin) au pipeline"""
+        audio_message = InputMessage(
+            data=audio_bytes,
+            metadata={
+                "client_id": client_id,
+                "format": metadata.get("format", self.audio_format),
+                "sample_rate": metadata.get("sample_rate", self.sample_rate),
+                "channels": metadata.get("channels", 1),
+                "chunk_index": metadata.get("chunk_index", 0),
+                "timestamp": time.time()
+            }
+        )
+        self.output_queue.enqueue(audio_message)
+        logger.info("Audio message queued for processing")
+    
+    def _handle_msgpack_message(self, client_id: str, message: bytes):
+        """Frame binaire d'un client msgpack : {"type": "audio", "data": <bin>, "metadata": {...}}"""
+        try:
+            data = loads_msgpack(message)
+        except Exception:
+            logger.error(f"Invalid msgpack frame from {client_id}: {len(message)} bytes")
+            return
+        
+        if not isinstance(data, dict) or data.get("type") != "audio" or not isinstance(data.get("data"), bytes):
+            logger.warning(f"Unknown msgpack message format from {client_id}")
+            return
+        if self.mode not in ["audio_to_text", "audio_text_to_text_audio"]:
+            return
+        
+        metadata = data.get("metadata")
+        logger.info("Processing msgpack audio message from %s: %d bytes", client_id, len(data['data']))
+        self._enqueue_client_audio(client_id, data["data"], metadata if isinstance(metadata, dict) else {})
+    
+    def _broadcast(self, message: Dict):
+        """Diffuse un message à tous les clients ouverts via websockets.broadcast : écritures
+        non bloquantes dans le buffer de chaque connexion (un client lent ne retarde pas les
+        autres), un encodage par sous-protocole. broadcast ignore les connexions qui ne sont
+        plus ouvertes. Renvoie le nombre de connexions ciblées"""
+        from websockets import broadcast
+        
+        by_protocol = {}
+        for _, websocket in self._connections_snapshot:
+            by_protocol.setdefault(websocket.subprotocol, []).append(websocket)
+        
+        for targets in by_protocol.values():
+            broadcast(targets, _encode_for(targets[0], message), text=_is_text(targets[0]))
+        return len(self._connections_snapshot)
+    
+    async def _reap_closed_connections(self):
+        """Retire chaque seconde les connexions fermées que leur handler n'a pas encore
+        retirées : les chemins d'envoi ne testent pas l'état de la connexion"""
+        while self.running:
+            await asyncio.sleep(1.0)
+            for client_id, websocket in self._connections_snapshot:
+                if websocket.close_code is not None and self._remove_connection(client_id):
+                    logger.info(f"🗑️ Removed disconnected client {client_id}")
+    
+    def _add_connection(self, client_id: str, websocket):
+        self.connections[client_id] = websocket
+        self._connections_snapshot = tuple(self.connections.items())
+    
+    def _remove_connection(self, client_id: str) -> bool:
+        """Retire un client ; False s'il n'était pas (ou plus) connecté"""
+        if self.connections.pop(client_id, None) is None:
+            return False
+        self._audio_json_prefixes.pop(client_id, None)
+        self._connections_snapshot = tuple(self.connections.items())
+        return True
     
     async def start_server(self):
         try:
             import websockets
+            from websockets.extensions import permessage_deflate
+            
+            if self.compression_level is None:
+                extensions = []
+            else:
+                extensions = [permessage_deflate.ServerPerMessageDeflateFactory(
+                    server_max_window_bits=15,
+                    client_max_window_bits=15,
+                    server_no_context_takeover=False,
+                    client_no_context_takeover=False,
+                    compress_settings={"level": self.compression_level}
+                )]
+            
             self.websocket_server = await websockets.serve(
-                self.websocket_handler, self.host, self.port
+                self.websocket_handler, self.host, self.port,
+                subprotocols=SUBPROTOCOLS,
+                select_subprotocol=_select_subprotocol,
+                compression=None,
+                extensions=extensions
             )
+            self._reaper_task = asyncio.get_running_loop().create_task(self._reap_closed_connections())
             print(f"WebSocket server started on {self.host}:{self.port}")
             if self.pipeline_capabilities:
                 print(f"Pipeline: {self.pipeline_name}")
@@ -356,15 +577,10 @@ class WebSocketStep(PipelineStep):
         }
         
         try:
-            # Vérifier l'état de la connexion WebSocket
-            if websocket.close_code is not None:
-                logger.warning(f"WebSocket {client_id} is closed, removing from connections")
-                if client_id in self.connections:
-                    del self.connections[client_id]
-                return
-                
-            await websocket.send(json.dumps(message))
-            logger.debug(f"✅ Sent to {client_id}: '{text[:30]}{'...' if len(text) > 30 else ''}'")
+            # Connexion fermée : send lève ConnectionClosed (rattrapé ci-dessous),
+            # l'entrée est retirée par son handler ou par _reap_closed_connections
+            await websocket.send(_encode_for(websocket, message), text=_is_text(websocket))
+            logger.debug("✅ Sent to %s: '%.30s'", client_id, text)
         except Exception as e:
             logger.warning(f"⚠️  Temporary error sending to {client_id}: {e}")
             # Ne pas supprimer la connexion immédiatement - elle pourrait être temporairement occupée
@@ -378,36 +594,53 @@ class WebSocketStep(PipelineStep):
         websocket = self.connections[client_id]
         
         try:
-            # Vérifier l'état de la connexion WebSocket
-            if websocket.close_code is not None:
-                logger.warning(f"WebSocket {client_id} is closed, removing from connections")
-                if client_id in self.connections:
-                    del self.connections[client_id]
-                return
-            
-            # Encoder l'audio en base64 pour transmission JSON
-            audio_b64 = base64.b64encode(audio_data).decode()
-            
-            message = {
-                "type": "audio_chunk",
-                "data": audio_b64,
-                "timestamp": time.time(),
-                "metadata": metadata
-            }
+            if websocket.subprotocol == SUBPROTOCOL_MSGPACK:
+                # Audio brut en bin msgpack
+                message = {
+                    "type": "audio_chunk",
+                    "data": audio_data,
+                    "timestamp": time.time(),
+                    "metadata": metadata
+                }
+                frame = dumps_msgpack(message)
+            else:
+                # Le cache de préfixes n'est lu/écrit que sur la boucle : seul l'encodage
+                # (base64 + assemblage, sans état partagé) peut partir dans un thread
+                prefix = self._audio_json_prefix(client_id, metadata)
+                if len(audio_data) > self.audio_offload_bytes:
+                    frame = await asyncio.to_thread(_audio_json_frame, prefix, audio_data)
+                else:
+                    frame = _audio_json_frame(prefix, audio_data)
             
-            await websocket.send(json.dumps(message))
-            logger.debug(f"✅ Sent audio chunk to {client_id}: {len(audio_data)} bytes")
+            await websocket.send(frame, text=_is_text(websocket))
+            logger.debug("✅ Sent audio chunk to %s: %d bytes", client_id, len(audio_data))
         except Exception as e:
             logger.warning(f"⚠️  Temporary error sending audio to {client_id}: {e}")
             # Ne pas supprimer la connexion immédiatement - elle pourrait être temporairement occupée
 
+    def _audio_json_prefix(self, client_id: str, metadata: dict) -> bytes:
+        """Début de la frame JSON audio_chunk, jusqu'à l'ouverture de "data" : seule une
+        metadata différente de celle du chunk précédent est ré-encodée"""
+        static = dict(metadata)
+        metadata_timestamp = static.pop("timestamp", None)
+        cached = self._audio_json_prefixes.get(client_id)
+        if cached is None or cached[0] != static:
+            # Objet metadata sans son "}" final, complété chunk par chunk
+            cached = (static, b'{"type":"audio_chunk","metadata":' + dumps_json(static)[:-1])
+            self._audio_json_prefixes[client_id] = cached
+        
+        prefix = cached[1]
+        if metadata_timestamp is not None:
+            prefix += (b"," if static else b"") + b'"timestamp":' + dumps_json(metadata_timestamp)
+        return prefix + b'},"data":"'
+    
     async def broadcast_text(self, text: str):
         """Broadcast simple text (pour compatibilité)"""
         await self.broadcast_text_with_metadata(text, {})
     
     async def broadcast_text_with_metadata(self, text: str, metadata: dict):
         """Broadcast text avec métadonnées"""
-        logger.info(f"🔊 Broadcasting to {len(self.connections)} clients: '{text[:30]}{'...' if len(text) > 30 else ''}'")
+        logger.info("🔊 Broadcasting to %d clients: '%.30s'", len(self.connections), text)
         
         if not self.connections:
             logger.warning("❌ No connections to broadcast to")
@@ -419,51 +652,18 @@ class WebSocketStep(PipelineStep):
             "timestamp": time.time(),
             "metadata": metadata
         }
-        
-        disconnected = []
-        sent_count = 0
-        for client_id, websocket in self.connections.items():
-            try:
-                # Vérifier l'état de la connexion WebSocket
-                if websocket.close_code is not None:
-                    logger.warning(f"WebSocket {client_id} is closed")
-                    disconnected.append(client_id)
-                    continue
-                    
-                await websocket.send(json.dumps(message))
-                sent_count += 1
-                logger.debug(f"✅ Sent to {client_id}")
-            except Exception as e:
-                logger.warning(f"⚠️  Temporary error broadcasting to {client_id}: {e}")
-                # Ne pas ajouter à disconnected - erreur temporaire possible
-        
-        logger.info(f"📤 Sent to {sent_count}/{len(self.connections)} clients")
-        
-        for client_id in disconnected:
-            if client_id in self.connections:
-                del self.connections[client_id]
-                logger.info(f"🗑️ Removed disconnected client {client_id}")
+        sent_count = self._broadcast(message)
+        logger.info("📤 Sent to %d/%d clients", sent_count, len(self.connections))
     
     async def broadcast_audio(self, audio_data: bytes):
         if not self.connections:
             return
         
-        audio_b64 = base64.b64encode(audio_data).decode()
-        
+        # Audio brut : bin msgpack, ou base64 à l'encodage JSON (une fois par sous-protocole)
         message = {
             "type": "audio_chunk",
-            "data": audio_b64,
+            "data": audio_data,
             "format": "pcm",
             "timestamp": time.time()
         }
-        
-        disconnected = []
-        for client_id, websocket in self.connections.items():
-            try:
-                await websocket.send(json.dumps(message))
-            except:
-                disconnected.append(client_id)
-        
-        for client_id in disconnected:
-            if client_id in self.connections:
-                del self.connections[client_id]
\ No newline at end of file
+        self._broadcast(message)
\ No newline at end of file
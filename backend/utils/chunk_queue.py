@@ -2,6 +2,7 @@ import threading
 import asyncio
 import queue
 import inspect
+import itertools
 import time
 
 class ChunkQueue(queue.PriorityQueue):
@@ -15,7 +16,7 @@ class ChunkQueue(queue.PriorityQueue):
             except queue.Empty:
                 continue
 
-    def wrapper_targetFuncAsync(self, f, looper):
+    def wrapper_targetFuncAsync(self, f, looper, external_loop=False):
         async def wait_for_f(chunk):
             await f(chunk)
         
@@ -29,7 +30,9 @@ class ChunkQueue(queue.PriorityQueue):
                 item = self.get(timeout=1)  #Wait for a chunk
                 priority, timestamp, counter, chunk = item
                 try:
-                    if looper.is_running():
+                    # Boucle fournie par le step : toujours exécuté dessus (run_coroutine_threadsafe
+                    # attend qu'elle tourne), jamais depuis ce thread
+                    if external_loop or looper.is_running():
                         future = asyncio.run_coroutine_threadsafe(f(chunk), looper)
                         result = future.result()
                     else:
@@ -43,23 +46,29 @@ class ChunkQueue(queue.PriorityQueue):
             except queue.Empty:
                 continue
 
-    def __init__(self, size = 0, handler = None, priority = 2):
+    def __init__(self, size = 0, handler = None, priority = 2, loop = None):
         super().__init__(size)
         self.is_running = threading.Event()
         self.is_running.clear()  # Initialise à False pour que les workers démarrent
         self.priority = priority  # Priorité fixe pour cette queue (0=critical, 2=normal)
         self.looper = None
-        self._mutex = threading.Lock()
-        self._counter = 0  # Compteur pour éviter la comparaison directe d'objets dans PriorityQueue
+        # Compteur pour éviter la comparaison directe d'objets dans PriorityQueue.
+        # next() sur itertools.count est atomique (implémenté en C, sous le GIL) :
+        # pas besoin de verrou en plus de celui de la PriorityQueue
+        self._counter = itertools.count(1)
         if handler is not None:
             if inspect.iscoroutinefunction(handler):
-                try:
-                    self.looper = asyncio.get_running_loop()
-                except RuntimeError:
-                    # Pas de loop en cours, en créera un si nécessaire
-                    self.looper = None
+                if loop is not None:
+                    # Handler exécuté sur la boucle du step (ex. celle de son serveur)
+                    self.looper = loop
+                else:
+                    try:
+                        self.looper = asyncio.get_running_loop()
+                    except RuntimeError:
+                        # Pas de loop en cours, en créera un si nécessaire
+                        self.looper = None
                 threading.Thread(target=self.wrapper_targetFuncAsync,
-                             args=[handler, self.looper], daemon=True).start()
+                             args=[handler, self.looper, loop is not None], daemon=True).start()
             else:
                 threading.Thread(target=self.wrapper_targetFuncSync,
                              args=[handler], daemon=True).start()
@@ -81,12 +90,9 @@ class ChunkQueue(queue.PriorityQueue):
         self.flush()
 
     def enqueue(self, chunk):
-        with self._mutex:
-            # Incrémenter le compteur pour éviter la comparaison directe d'objets
-            self._counter += 1
-            # Tuple à 4 éléments : (priorité, timestamp, compteur, chunk)
-            # Le compteur garantit qu'aucune comparaison directe d'objets n'aura lieu
-            item = (self.priority, time.time(), self._counter, chunk)
-            self.put(item)
-            # Automatic yield: Allow worker thread to process immediately
-            time.sleep(0)  # Force scheduler yield for real-time streaming
+        # Tuple à 4 éléments : (priorité, timestamp, compteur, chunk)
+        # Le compteur garantit qu'aucune comparaison directe d'objets n'aura lieu
+        item = (self.priority, time.time(), next(self._counter), chunk)
+        self.put(item)
+        # Automatic yield: Allow worker thread to process immediately
+        time.sleep(0)  # Force scheduler yield for real-time streaming
@@ -0,0 +1,115 @@
+import base64
+import importlib
+import json
+from enum import Enum
+from types import MappingProxyType
+from typing import Any, Dict
+
+__all__ = [
+    "dumps_json",
+    "loads_json",
+    "dumps_msgpack",
+    "loads_msgpack",
+    "msgpack_packer",
+    "b64encode",
+    "b64encode_text",
+    "b64decode",
+]
+
+# msgpack/orjson/pybase64 ne sont importés qu'à la première utilisation : importer
+# les messages (fait par tous les steps) ne paie pas leur coût de chargement
+_codecs: Dict[str, Any] = {}
+
+
+def _load_codec(name: str):
+    try:
+        return _codecs[name]
+    except KeyError:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            module = None
+        _codecs[name] = module
+        return module
+
+
+def __getattr__(name: str):
+    if name == "MSGPACK_AVAILABLE":
+        return _load_codec("msgpack") is not None
+    if name == "ORJSON_AVAILABLE":
+        return _load_codec("orjson") is not None
+    if name == "PYBASE64_AVAILABLE":
+        return _load_codec("pybase64") is not None
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Type non sérialisable en msgpack: {type(obj).__name__}")
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return b64encode_text(obj)
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Type non sérialisable en JSON: {type(obj).__name__}")
+
+
+# base64 de l'audio en JSON : pybase64 (SIMD) si disponible, sinon module standard
+def b64encode(data: Any) -> bytes:
+    pybase64 = _load_codec("pybase64")
+    if pybase64 is not None:
+        return pybase64.b64encode(data)
+    return base64.b64encode(data)
+
+
+def b64encode_text(data: Any) -> str:
+    pybase64 = _load_codec("pybase64")
+    if pybase64 is not None:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode()
+
+
+def b64decode(data: Any) -> bytes:
+    pybase64 = _load_codec("pybase64")
+    if pybase64 is not None:
+        return pybase64.b64decode(data)
+    return base64.b64decode(data)
+
+
+def dumps_json(payload: Any) -> bytes:
+    """Encode en JSON (bytes UTF-8) via orjson si disponible, sinon json standard"""
+    orjson = _load_codec("orjson")
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_json_default, ensure_ascii=False).encode()
+
+
+def loads_json(data: Any) -> Any:
+    """Décode du JSON (str ou bytes) via orjson si disponible, sinon json standard.
+    Les erreurs de décodage sont des ValueError (json.JSONDecodeError) dans les deux cas."""
+    orjson = _load_codec("orjson")
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_msgpack(payload: Any) -> bytes:
+    """Encode en msgpack : les bytes (audio) partent en bin, sans base64"""
+    return _load_codec("msgpack").packb(payload, use_bin_type=True, default=_msgpack_default)
+
+
+def loads_msgpack(data: bytes) -> Any:
+    """Décode du msgpack (bin -> bytes, str -> str)"""
+    return _load_codec("msgpack").unpackb(data, raw=False)
+
+
+def msgpack_packer():
+    """Packer msgpack réutilisable (mêmes options que dumps_msgpack). Non thread-safe."""
+    return _load_codec("msgpack").Packer(use_bin_type=True, autoreset=True, default=_msgpack_default)